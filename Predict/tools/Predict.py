@@ -1,4 +1,6 @@
 import os
+import sys
+import argparse
 import pandas as pd
 import torch
 import numpy as np
@@ -9,54 +11,30 @@ import pickle
 from tqdm import tqdm
 from torch_geometric.data import DataLoader
 import random
-import torch.nn as nn
 import torch.optim as optim
-from torch_geometric.nn import GCNConv, global_mean_pool
-from torch_geometric.nn import GATConv
-import torch.nn.functional as F
 os.environ['CUDA_LAUNCH_BLOCKING'] = '1' 
 
+# GATClassifier and the int8 tooling live at the repository root
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT_DIR)
+from gatsol_model import GATClassifier
+from gatsol_sink import make_rows, open_sink, written_ids
+
 def name_seq_dict(path):
     pdb_chain_list = pd.read_csv(path, header=0)
     dict_pdb_chain = pdb_chain_list.set_index('id')['sequence'].to_dict()
     return dict_pdb_chain
 
-# 定义图神经网络模型
-class GATClassifier(nn.Module):
-    def __init__(self, in_channels, hidden_channels, num_heads, num_layers):
-        super(GATClassifier, self).__init__()
-        self.convs = nn.ModuleList()
-        for i in range(num_layers):
-            if i == 0:
-                self.convs.append(GATConv(in_channels, hidden_channels, heads=num_heads))
-            else:
-                self.convs.append(GATConv(hidden_channels * num_heads, hidden_channels, heads=num_heads))
-        self.lin1 = nn.Linear(hidden_channels * num_heads, 128)
-        self.lin2 = nn.Linear(128, 1)
-
-    def forward(self, data):
-        x, edge_index, batch = data.x, data.edge_index, data.batch
-        for conv in self.convs:
-            x = F.relu(conv(x, edge_index))
-        x = global_mean_pool(x, batch)
-        x = F.relu(self.lin1(x))
-        x = self.lin2(x)
-        # x = self.lin1(x)
-        return x.squeeze()
-
-def predictions(model, device, loader):
+def predict_to_sink(model, device, loader, names, sequences, sink, schema):
+    # 每个batch的预测结果立即写入输出文件
     model.eval()
-    y_hat = torch.tensor([]).cuda()
-    y_true = torch.tensor([]).cuda()
     with torch.no_grad():
         for data in tqdm(loader):
             data = data.to(device)
-            output = model(data)
-            if output.dim() == 0:
-                output = output.unsqueeze(0)
-            y_hat = torch.cat((y_hat, output),0) 
-            y_true = torch.cat((y_true, data.y),0)
-    return y_hat, y_true
+            output = model(data).reshape(-1).cpu().tolist()
+            batch_names = names[:len(output)]
+            del names[:len(output)]
+            sink.write(make_rows(batch_names, [sequences[n] for n in batch_names], output, schema))
 
 def print_box(message):
     box_width = 40
@@ -69,27 +47,45 @@ def print_box(message):
     print(padding_str + message + ' ' * (box_width - len(padding_str) - len(message)) + '*')
     print(border)
 
+parser = argparse.ArgumentParser(description="GATSol prediction over NEED_to_PREPARE/pkl.")
+parser.add_argument("--list", default="./NEED_to_PREPARE/list.csv", help="CSV with id,sequence columns")
+parser.add_argument("--pkl_dir", default="./NEED_to_PREPARE/pkl", help="Directory holding the <id>.pkl graphs")
+parser.add_argument("--checkpoint", default=os.path.join(ROOT_DIR, "check_point", "best_model", "best_model.pt"), help="GATClassifier state_dict")
+parser.add_argument("--quantized", nargs="?", const=os.path.join(ROOT_DIR, "check_point", "best_model", "best_model_int8.pt"), default=None,
+                    help="Serve the int8 model written by gatsol_quantize.py on the CPU")
+parser.add_argument("--out", default="./Output.csv", help="Output file (.csv, .jsonl or .parquet)")
+parser.add_argument("--format", choices=["csv", "jsonl", "parquet"], default=None, help="Output format, inferred from --out by default")
+parser.add_argument("--standardized", action="store_true", help="Write the benchmarking wrapper's schema instead of id,sequence,Solubility_hat")
+parser.add_argument("--flush_interval", type=float, default=5.0, help="Seconds between durable flushes of the output")
+parser.add_argument("--resume", action="store_true", help="Keep rows already in --out and only predict the missing ids")
+args = parser.parse_args()
+schema = "standard" if args.standardized else "raw"
+
+# 设置训练参数
+device = torch.device('cuda' if torch.cuda.is_available() and not args.quantized else 'cpu')
+
 # 在框框中间显示 "Prediction begin"
 print_box("Prediction Begin")
 
-pkl_path = "./NEED_to_PREPARE/pkl"
-name_dict = name_seq_dict("./NEED_to_PREPARE/list.csv")
+pkl_path = args.pkl_dir
+name_dict = name_seq_dict(args.list)
 file_names = list(name_dict.keys())
+if args.resume:
+    done = written_ids(args.out, args.format, schema)
+    file_names = [name for name in file_names if name not in done]
 
 test_dataset = [] # data数据对象的list集合
 
 for filename in file_names:
   file_path = os.path.join(pkl_path, filename+".pkl")
   with open(file_path, 'rb') as f:
-    data = pickle.load(f).to(torch.device('cuda'))
+    data = pickle.load(f).to(device)
   test_dataset.append(data)
 
 
 batch_size = 1
 test_loader = DataLoader(test_dataset, batch_size = batch_size, shuffle=False)
 
-# 设置训练参数
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 in_channels = 1300  # 输入特征的维度
 hidden_channels = 1024  # 隐层特征的维度
 num_classes = 1  # 分类类别的数量
@@ -97,20 +93,15 @@ num_heads = 16  # 注意力头的数量
 num_layers = 2  # 网络层数
 
 # 创建模型实例
-model = GATClassifier(in_channels, hidden_channels, num_heads, num_layers).to(device)
-
-model.load_state_dict(torch.load("../check_point/best_model/best_model.pt"))
+if args.quantized:
+    from gatsol_quantize import load_quantized
+    model = load_quantized(args.quantized)
+else:
+    model = GATClassifier(in_channels, hidden_channels, num_heads, num_layers).to(device)
+    model.load_state_dict(torch.load(args.checkpoint, map_location=device))
 model.eval()
 
-y_hat, y_true = predictions(model, device, test_loader)
-
-y_hat = list(y_hat.cpu().numpy())
-
-df = pd.read_csv("./NEED_to_PREPARE/list.csv")
-
-df["Solubility_hat"] = y_hat
-
-# 保存修改后的 DataFrame 到 CSV 文件
-df.to_csv("./Output.csv", index=False)
+with open_sink(args.out, args.format, schema, args.flush_interval, append=args.resume) as sink:
+    predict_to_sink(model, device, test_loader, list(file_names), name_dict, sink, schema)
 
-print_box("Prediction Completed and Check the Output.csv")
+print_box(f"Prediction Completed and Check the {os.path.basename(args.out)}")
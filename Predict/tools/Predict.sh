@@ -1,13 +1,32 @@
 #!/bin/sh
 
-mkdir -p ./NEED_to_PREPARE/cm
+# usage: bash ./tools/Predict.sh [--input_dir DIR] [--work_dir DIR] [Predict.py options]
+#   --input_dir  holds list.csv, fasta/ and pdb/      (default ./NEED_to_PREPARE)
+#   --work_dir   receives cm/ and pkl/, removed at the end, and feature_extra.log (default: --input_dir)
+# Concurrent jobs must each use their own --input_dir/--work_dir and --out.
 
-bash ./tools/pdb_to_cm/pdb_to_cm.sh
+set -e
 
-mkdir -p ./NEED_to_PREPARE/pkl
+toolsDir=$(cd "$(dirname "$0")" && pwd)
+inputDir=./NEED_to_PREPARE
+workDir=
+while [ $# -gt 0 ]; do
+  case "$1" in
+    --input_dir) inputDir=$2; shift 2 ;;
+    --work_dir) workDir=$2; shift 2 ;;
+    *) break ;;
+  esac
+done
+workDir=${workDir:-$inputDir}
 
-python ./tools/feature_extract/feature_extra.py
+mkdir -p "$workDir/cm"
 
-python ./tools/Predict.py
+bash "$toolsDir/pdb_to_cm/pdb_to_cm.sh" "$inputDir/pdb" "$workDir/cm"
 
-rm -rf ./NEED_to_PREPARE/cm&&rm -rf ./NEED_to_PREPARE/pkl
\ No newline at end of file
+mkdir -p "$workDir/pkl"
+
+python "$toolsDir/feature_extract/feature_extra.py" --list "$inputDir/list.csv" --fasta_dir "$inputDir/fasta" --cm_dir "$workDir/cm" --pkl_dir "$workDir/pkl" --log "$workDir/feature_extra.log"
+
+python "$toolsDir/Predict.py" --list "$inputDir/list.csv" --pkl_dir "$workDir/pkl" "$@"
+
+rm -rf "$workDir/cm"&&rm -rf "$workDir/pkl"
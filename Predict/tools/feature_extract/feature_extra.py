@@ -13,8 +13,15 @@ import logging
 from torch_geometric.utils import add_self_loops
 import contextlib
 import io
+import sys
+import argparse
 import esm
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".."))
+from gatsol_adjacency import prepare_graph  # noqa: E402
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # Load ESM-1b model
 model, alphabet = esm.pretrained.esm1b_t33_650M_UR50S()
 batch_converter = alphabet.get_batch_converter()
@@ -43,17 +50,12 @@ def print_box(message):
     print(padding_str + message + ' ' * (box_width - len(padding_str) - len(message)) + '*')
     print(border)
 
-def process_file(file, batch_converter = batch_converter, model = model):
-  dict_path = './NEED_to_PREPARE/list.csv'
-  seq_dict = name_seq_dict(dict_path)
+def process_file(file, seq_dict, fasta_directory, cm_directory, pkl_directory, batch_converter = batch_converter, model = model):
   # 执行指令的代码
-  cm_directory = "./NEED_to_PREPARE/cm"
-  fasta_directory = "./NEED_to_PREPARE/fasta"
-
   try:
     cm_path = os.path.join(cm_directory,file+".cm")
     fasta_path = os.path.join(fasta_directory,file+".fasta")
-    pkl_path = os.path.join("./NEED_to_PREPARE/pkl",file+".pkl")
+    pkl_path = os.path.join(pkl_directory,file+".pkl")
     
     #esm feature
     batch_labels, batch_strs, batch_tokens = batch_converter([(file, seq_dict[file])])
@@ -67,7 +69,7 @@ def process_file(file, batch_converter = batch_converter, model = model):
 
     # 使用 redirect_stdout 上下文管理器将标准输出重定向到空文件
     with contextlib.redirect_stdout(null_file):
-      protein.import_parameters('./tools/feature_extract/Protein_parameters_setting.json')
+      protein.import_parameters(os.path.join(TOOLS_DIR, 'Protein_parameters_setting.json'))
 
     protein.get_descriptor("BLOSUM62")
 
@@ -86,21 +88,32 @@ def process_file(file, batch_converter = batch_converter, model = model):
     label = torch.tensor(0).reshape(1,)
     data = Data(x=node_features, edge_index=edges.t().contiguous() - 1, y=label)
     data.edge_index, _ = add_self_loops(data.edge_index, num_nodes=node_features.shape[0])
+    # 随图一起保存有序的CSR邻接矩阵
+    data = prepare_graph(data)
     with open(pkl_path, 'wb') as fpkl:
       pickle.dump(data, fpkl)
   except Exception as e:
     logging.error(f"Error processing {file}: {str(e)}")
     
 def main():
+  # 每个任务可以使用独立的输入/工作目录，默认仍为 ./NEED_to_PREPARE
+  parser = argparse.ArgumentParser(description="Build GATSol graphs (BLOSUM62 + ESM-1b node features) from contact maps.")
+  parser.add_argument("--list", default='./NEED_to_PREPARE/list.csv', help="CSV with id,sequence columns")
+  parser.add_argument("--fasta_dir", default='./NEED_to_PREPARE/fasta', help="Directory holding <id>.fasta")
+  parser.add_argument("--cm_dir", default='./NEED_to_PREPARE/cm', help="Directory holding <id>.cm from pdb_to_cm")
+  parser.add_argument("--pkl_dir", default='./NEED_to_PREPARE/pkl', help="Where the <id>.pkl graphs are written")
+  parser.add_argument("--log", default=os.path.join(TOOLS_DIR, 'log.log'), help="Error log")
+  args = parser.parse_args()
+
   # 配置logging
-  logging.basicConfig(filename='./tools/feature_extract/log.log', level=logging.ERROR, format='%(asctime)s %(levelname)s: %(message)s')
+  logging.basicConfig(filename=args.log, level=logging.ERROR, format='%(asctime)s %(levelname)s: %(message)s')
 
-  dict_path = './NEED_to_PREPARE/list.csv'
-  name_dict = name_seq_dict(dict_path)
+  name_dict = name_seq_dict(args.list)
   file_names = list(name_dict.keys())
+  os.makedirs(args.pkl_dir, exist_ok=True)
   
   for name in tqdm(file_names):
-    process_file(file = name, batch_converter = batch_converter, model = model)
+    process_file(name, name_dict, args.fasta_dir, args.cm_dir, args.pkl_dir, batch_converter = batch_converter, model = model)
   
 if __name__ == '__main__':
   print_box("Protein Graph Generation Begin")
@@ -5,15 +5,22 @@
 eval "$(conda shell.bash hook)"
 conda activate GATSol
 
+#################### input / output dirs #######################
+# usage: bash pdb_to_cm.sh [pdb_dir] [cm_dir]   (default ./NEED_to_PREPARE/pdb ./NEED_to_PREPARE/cm)
+scriptDir=$(cd "$(dirname "$0")" && pwd)
+pdbDir=${1:-./NEED_to_PREPARE/pdb}
+cmDir=${2:-./NEED_to_PREPARE/cm}
+mkdir -p "$cmDir"
+
 #################### prcessing all fna files #######################
 counter=0
-sourceDir=`ls ./NEED_to_PREPARE/pdb/`
-num=`ls ./NEED_to_PREPARE/pdb/ | wc -l`
+sourceDir=`ls "$pdbDir"`
+num=`ls "$pdbDir" | wc -l`
 for name in $sourceDir
 do
 	((counter=counter+1))
 	name="${name/.pdb/}"
-	python ./tools/pdb_to_cm/pdb_to_cm.py "./NEED_to_PREPARE/pdb/"$name".pdb" "./NEED_to_PREPARE/cm/$name.cm" -t 10.0
+	python "$scriptDir/pdb_to_cm.py" "$pdbDir/$name.pdb" "$cmDir/$name.cm" -t 10.0
 	echo "$name $counter/$num --.pdb files completed"
 done
 
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Sorted CSR adjacency cached on GATSol graphs
+- prepare_graph: self-loops normalised once, edges sorted by target node, and the
+  transposed adjacency stored as data.adj_t (torch_sparse.SparseTensor when installed,
+  otherwise a torch sparse CSR tensor with torch-geometric >= 2.4); with neither,
+  graphs keep the plain edge_index
+- GATConv still gathers and scatters per edge; the cached layout only saves rebuilding
+  it on every forward pass
+- The CLI converts a pickled dataset dict or a directory of per-protein .pkl files
+
+Usage:
+    python gatsol_adjacency.py --dataset dataset/GATSol_datasets.pkl --out dataset/GATSol_datasets_csr.pkl
+    python gatsol_adjacency.py --pkl_dir path/to/pkl --out path/to/pkl_csr
+"""
+import os
+import pickle
+import argparse
+import torch
+import torch_geometric
+from torch_geometric.utils import add_self_loops, coalesce, remove_self_loops
+
+try:
+    from torch_sparse import SparseTensor
+except ImportError:
+    SparseTensor = None
+
+# GATConv accepts a torch sparse CSR adjacency only from torch-geometric 2.4 on
+CSR_AVAILABLE = SparseTensor is not None or tuple(
+    int(v) for v in torch_geometric.__version__.split(".")[:2]) >= (2, 4)
+
+
+def adjacency(data):
+    """Adjacency to hand to GATConv: the cached adj_t when present, else edge_index."""
+    return data.adj_t if "adj_t" in data else data.edge_index
+
+
+def _adj_t(edge_index, num_nodes):
+    # adj_t[i, j] != 0 for an edge j -> i, rows are the aggregating (target) nodes
+    if SparseTensor is not None:
+        return SparseTensor(row=edge_index[1], col=edge_index[0], sparse_sizes=(num_nodes, num_nodes)).fill_cache_()
+    from torch_geometric.utils import to_torch_csr_tensor
+    return to_torch_csr_tensor(edge_index.flip(0), size=(num_nodes, num_nodes))
+
+
+def prepare_graph(data):
+    """Sort edge_index by target, keep exactly one self-loop per node (as GATConv
+    would add), and attach the matching adj_t when GATConv can use it (CSR_AVAILABLE).
+    Graphs that already have adj_t are returned unchanged."""
+    if "adj_t" in data:
+        return data
+    num_nodes = data.num_nodes
+    edge_index, _ = remove_self_loops(data.edge_index)
+    edge_index, _ = add_self_loops(edge_index, num_nodes=num_nodes)
+    data.edge_index = coalesce(edge_index, num_nodes=num_nodes, sort_by_row=False)
+    if CSR_AVAILABLE:
+        data.adj_t = _adj_t(data.edge_index, num_nodes)
+    return data
+
+
+def prepare_dataset(graphs):
+    return [prepare_graph(data) for data in graphs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persist sorted CSR adjacency with GATSol graphs.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dataset", help="Pickled dict of graph lists, e.g. dataset/GATSol_datasets.pkl")
+    source.add_argument("--pkl_dir", help="Directory of per-protein .pkl graphs")
+    parser.add_argument("--out", required=True, help="Output dataset file or directory")
+    args = parser.parse_args()
+
+    if args.dataset:
+        with open(args.dataset, "rb") as f:
+            datasets = torch.load(f, weights_only=False)
+        for split, graphs in datasets.items():
+            datasets[split] = prepare_dataset(graphs)
+            print(f"{split}: {len(graphs)} graphs")
+        torch.save(datasets, args.out)
+    else:
+        os.makedirs(args.out, exist_ok=True)
+        names = [name for name in sorted(os.listdir(args.pkl_dir)) if name.endswith(".pkl")]
+        for name in names:
+            with open(os.path.join(args.pkl_dir, name), "rb") as f:
+                data = prepare_graph(pickle.load(f))
+            with open(os.path.join(args.out, name), "wb") as f:
+                pickle.dump(data, f)
+        print(f"{len(names)} graphs")
+    print(f"Written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
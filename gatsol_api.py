@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+In-process GATSol prediction API
+- predict(records) scores (id, sequence, structure) records inside the calling process
+- Pipelines (ESM-1b + GAT model) are loaded on first use and reused by later calls
+  with the same options
+- The CLI measures per-call wall time of predict() against the Predict.sh subprocess path
+
+Usage:
+    from gatsol_api import predict
+    scores = predict([("mbp", "AIEEGK...", "Predict/NEED_to_PREPARE/pdb/mbp.pdb")])
+
+    python gatsol_api.py --calls 5
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+from gatsol_model import DEFAULT_CHECKPOINT, ROOT_DIR
+from gatsol_pipeline import GATSolPipeline, load_records
+
+_PIPELINES = {}
+_LOCK = threading.Lock()
+
+
+def get_pipeline(checkpoint=DEFAULT_CHECKPOINT, **options):
+    """Shared GATSolPipeline for these options, loaded once per process."""
+    key = (os.path.abspath(checkpoint), tuple(sorted(options.items())))
+    with _LOCK:
+        if key not in _PIPELINES:
+            _PIPELINES[key] = GATSolPipeline(checkpoint, **options)
+        return _PIPELINES[key]
+
+
+def as_record(record):
+    """(id, sequence, structure) from a tuple or a dict with id, sequence and one of
+    structure / pdb_path / pdb (PDB text) / coords (N x 3 CA array)."""
+    if isinstance(record, dict):
+        for key in ("structure", "pdb_path", "pdb", "coords"):
+            if record.get(key) is not None:
+                return record["id"], record["sequence"], record[key]
+        raise ValueError(f"Record {record.get('id')!r} has no structure")
+    sid, sequence, structure = record
+    return sid, sequence, structure
+
+
+def predict(records, checkpoint=DEFAULT_CHECKPOINT, chunk_size=None, **options):
+    """Solubility scores for records, in input order.
+
+    options are GATSolPipeline arguments (device, quantized, batch_size, ...). chunk_size
+    bounds how many graphs are held in memory at once.
+    """
+    records = [as_record(r) for r in records]
+    pipeline = get_pipeline(checkpoint, **options)
+    chunk_size = chunk_size or max(len(records), 1)
+    scores = []
+    for start in range(0, len(records), chunk_size):
+        scores.extend(pipeline.predict(records[start:start + chunk_size]))
+    return scores
+
+
+def _subprocess_call(records, checkpoint, workspace):
+    # the Predict.sh path the wrapper used before: write inputs, run three interpreters, read the CSV
+    import pandas as pd
+    from gatsol_predict_wrapper import prepare_workspace, run_pipeline
+    input_dir = prepare_workspace([(sid, seq) for sid, seq, _ in records],
+                                  {sid: structure for sid, _, structure in records}, workspace)
+    out = os.path.join(workspace, "out.csv")
+    run_pipeline(os.path.join(ROOT_DIR, "Predict"), workspace, out, checkpoint)
+    scores = pd.read_csv(out)["SolubilityScore"].tolist()
+    shutil.rmtree(input_dir)
+    os.remove(out)
+    return scores
+
+
+def main():
+    need_dir = os.path.join(ROOT_DIR, "Predict", "NEED_to_PREPARE")
+    parser = argparse.ArgumentParser(description="Per-call time of in-process predict() vs the Predict.sh subprocess path.")
+    parser.add_argument("--list", default=os.path.join(need_dir, "list.csv"), help="CSV with id,sequence columns")
+    parser.add_argument("--pdb_dir", default=os.path.join(need_dir, "pdb"), help="Directory holding <id>.pdb")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="GATClassifier state_dict")
+    parser.add_argument("--calls", type=int, default=5, help="Calls per path")
+    args = parser.parse_args()
+
+    records = load_records(args.list, args.pdb_dir)
+    timings = {"in-process": [], "subprocess": []}
+    scores = {}
+    for _ in range(args.calls):
+        start = time.perf_counter()
+        scores["in-process"] = predict(records, args.checkpoint)
+        timings["in-process"].append(time.perf_counter() - start)
+    with tempfile.TemporaryDirectory() as workspace:
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            scores["subprocess"] = _subprocess_call(records, os.path.abspath(args.checkpoint), workspace)
+            timings["subprocess"].append(time.perf_counter() - start)
+    for name, seconds in timings.items():
+        later = seconds[1:] or seconds
+        print(f"[{name}] first call: {seconds[0]:.2f}s, later calls: {sum(later) / len(later):.2f}s "
+              f"({len(records)} proteins per call)")
+    diff = max(abs(a - b) for a, b in zip(scores["in-process"], scores["subprocess"]))
+    print(f"max |score difference|: {diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Memory-aware batching for GATClassifier
+- CostModel: predicted activation memory of one graph, base + per-node + per-edge bytes,
+  either estimated from the model configuration or fitted on the local machine
+- pack / MemoryBudgetBatchSampler: batches whose predicted memory fills a budget,
+  usable as DataLoader(batch_sampler=...) in training and for inference batching
+- BucketBatchSampler: shuffling training batches within a node and edge budget, with
+  similar-sized proteins bucketed together
+- "calibrate" measures peak memory of single synthetic graphs and fits the cost model
+- "steps" compares step-time variance and throughput of fixed-size and bucketed batches
+
+Usage:
+    python gatsol_batching.py calibrate --mode train --out cost_model_train.json
+    python re_train.py --memory_budget 6000 --cost_model cost_model_train.json
+    python gatsol_batching.py steps --dataset dataset/GATSol_mmap --batch_size 4 --max_nodes 2000
+    python re_train.py --max_nodes 2000
+"""
+import json
+import time
+import random
+import argparse
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+from gatsol_model import IN_CHANNELS, HIDDEN_CHANNELS, NUM_HEADS, NUM_LAYERS
+
+FLOAT_BYTES = 4
+
+
+class CostModel:
+    """Predicted peak activation bytes of a graph: base + per_node * nodes + per_edge * edges.
+
+    Edge counts include the self-loop GATConv adds for every node.
+    """
+
+    def __init__(self, per_node, per_edge, base=0.0):
+        self.per_node = float(per_node)
+        self.per_edge = float(per_edge)
+        self.base = float(base)
+
+    @classmethod
+    def from_config(cls, in_channels=IN_CHANNELS, hidden_channels=HIDDEN_CHANNELS, num_heads=NUM_HEADS,
+                    num_layers=NUM_LAYERS, training=True):
+        # per layer: projected features, aggregated output and ReLU output per node; gathered
+        # source features plus attention coefficients per edge. Training keeps every layer's
+        # activations for backward, inference only needs the widest layer at a time.
+        width = hidden_channels * num_heads
+        per_node = FLOAT_BYTES * (in_channels + 3 * width * (num_layers if training else 1))
+        per_edge = FLOAT_BYTES * (width + 3 * num_heads) * (num_layers if training else 1)
+        return cls(per_node, per_edge)
+
+    @classmethod
+    def fit(cls, nodes, edges, peak_bytes):
+        """Non-negative least-squares fit of base/per_node/per_edge to measured peaks."""
+        from scipy.optimize import nnls
+        design = np.stack([np.ones(len(nodes)), np.asarray(nodes, float), np.asarray(edges, float)], axis=1)
+        # scale columns so the solver sees comparable magnitudes
+        scale = design.max(axis=0)
+        coef, _ = nnls(design / scale, np.asarray(peak_bytes, float))
+        base, per_node, per_edge = coef / scale
+        return cls(per_node, per_edge, base)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"per_node": self.per_node, "per_edge": self.per_edge, "base": self.base}, f, indent=2)
+
+    def graph_bytes(self, num_nodes, num_edges):
+        return self.per_node * num_nodes + self.per_edge * num_edges
+
+    def batch_bytes(self, sizes):
+        return self.base + sum(self.graph_bytes(n, e) for n, e in sizes)
+
+    def __call__(self, data):
+        return self.graph_bytes(data.num_nodes, _num_edges(data))
+
+    def __repr__(self):
+        return (f"CostModel(per_node={self.per_node / 2 ** 10:.1f} KB, per_edge={self.per_edge / 2 ** 10:.1f} KB, "
+                f"base={self.base / 2 ** 20:.1f} MB)")
+
+
+def _num_edges(data):
+    # GATConv replaces any self-loops in edge_index by exactly one per node; graphs prepared
+    # by gatsol_adjacency already have that form, feature_extra's graphs already hold them too
+    if "adj_t" in data:
+        return data.num_edges
+    edge_index = data.edge_index
+    return int((edge_index[0] != edge_index[1]).sum()) + data.num_nodes
+
+
+def pack(costs, budget, order=None, base=0.0, max_batch_size=None):
+    """Greedily group indices (in order) so each group's summed cost stays within budget - base.
+
+    A graph that alone exceeds the budget gets a batch of its own.
+    """
+    order = range(len(costs)) if order is None else order
+    limit = budget - base
+    batches, batch, total = [], [], 0.0
+    for i in order:
+        full = max_batch_size is not None and len(batch) >= max_batch_size
+        if batch and (total + costs[i] > limit or full):
+            batches.append(batch)
+            batch, total = [], 0.0
+        batch.append(i)
+        total += costs[i]
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _shard(batches, num_replicas, rank):
+    # every rank gets the same number of batches (data-parallel steps must line up)
+    if num_replicas == 1:
+        return batches
+    return batches[:len(batches) - len(batches) % num_replicas][rank::num_replicas]
+
+
+def graph_sizes(dataset):
+    """(nodes, edges incl. self-loops) per graph."""
+    if hasattr(dataset, "graph_sizes"):
+        # memory-mapped datasets know their sizes without reading every graph
+        return dataset.graph_sizes()
+    return [(data.num_nodes, _num_edges(data)) for data in dataset]
+
+
+class MemoryBudgetBatchSampler(Sampler):
+    """Batch sampler filling each batch up to a predicted memory budget (bytes).
+
+    With shuffle=True the dataset order is reshuffled every epoch before packing. With
+    num_replicas > 1 every rank packs the same batches (same seed) and takes every
+    num_replicas-th one; the remainder is dropped so all ranks run the same number of steps.
+    """
+
+    def __init__(self, dataset, cost_model, budget, shuffle=False, max_batch_size=None, seed=None,
+                 num_replicas=1, rank=0):
+        self.costs = [cost_model.graph_bytes(n, e) for n, e in graph_sizes(dataset)]
+        self.base = cost_model.base
+        self.budget = budget
+        self.shuffle = shuffle
+        self.max_batch_size = max_batch_size
+        self.rng = random.Random(seed)
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+    def _batches(self):
+        order = list(range(len(self.costs)))
+        if self.shuffle:
+            self.rng.shuffle(order)
+        return _shard(pack(self.costs, self.budget, order, self.base, self.max_batch_size), self.num_replicas, self.rank)
+
+    def __iter__(self):
+        return iter(self._batches())
+
+    def __len__(self):
+        # exact for a fixed order; an estimate when batches are re-packed after shuffling
+        return len(_shard(pack(self.costs, self.budget, base=self.base, max_batch_size=self.max_batch_size),
+                          self.num_replicas, self.rank))
+
+
+class BucketBatchSampler(Sampler):
+    """Shuffling batch sampler with at most max_nodes nodes and max_edges edges per batch.
+
+    Every epoch the graphs are shuffled and cut into pools of pool_size graphs; each pool is
+    sorted by node count and packed greedily, and the batches are shuffled again. Proteins of
+    similar length share a batch, while pool membership and batch order change every epoch.
+    A graph that alone exceeds the budget gets a batch of its own. indices restricts the
+    sampler to a subset (e.g. the training part of a K-fold split).
+    """
+
+    def __init__(self, dataset, max_nodes, max_edges=None, pool_size=256, max_batch_size=None, shuffle=True,
+                 seed=None, indices=None, num_replicas=1, rank=0):
+        sizes = graph_sizes(dataset)
+        self.indices = list(range(len(sizes))) if indices is None else [int(i) for i in indices]
+        self.nodes = {i: sizes[i][0] for i in self.indices}
+        self.edges = {i: sizes[i][1] for i in self.indices}
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        self.pool_size = pool_size
+        self.max_batch_size = max_batch_size
+        self.shuffle = shuffle
+        self.rng = random.Random(seed)
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+    def _fill(self, order):
+        batches, batch, nodes, edges = [], [], 0, 0
+        for i in order:
+            full = (nodes + self.nodes[i] > self.max_nodes
+                    or self.max_edges is not None and edges + self.edges[i] > self.max_edges
+                    or self.max_batch_size is not None and len(batch) >= self.max_batch_size)
+            if batch and full:
+                batches.append(batch)
+                batch, nodes, edges = [], 0, 0
+            batch.append(i)
+            nodes += self.nodes[i]
+            edges += self.edges[i]
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _batches(self, rng=None):
+        order = list(self.indices)
+        if rng is not None:
+            rng.shuffle(order)
+        batches = []
+        for start in range(0, len(order), self.pool_size):
+            batches.extend(self._fill(sorted(order[start:start + self.pool_size], key=self.nodes.__getitem__)))
+        if rng is not None:
+            rng.shuffle(batches)
+        return _shard(batches, self.num_replicas, self.rank)
+
+    def __iter__(self):
+        return iter(self._batches(self.rng if self.shuffle else None))
+
+    def __len__(self):
+        # exact without shuffling; an estimate when the pools are re-drawn every epoch
+        return len(self._batches())
+
+
+def calibrate(mode="train", sizes=(50, 100, 200, 400, 600, 800), device="cpu", in_channels=IN_CHANNELS,
+              hidden_channels=HIDDEN_CHANNELS, num_heads=NUM_HEADS, num_layers=NUM_LAYERS, repeats=2):
+    """Measure peak memory of single synthetic contact graphs and fit a CostModel."""
+    from torch_geometric.data import Batch, Data
+    from gatsol_dense_gat import _contact_graph
+    from gatsol_eval import PeakMemory
+    from gatsol_model import build_model
+
+    torch.manual_seed(0)
+    model = build_model(device, in_channels, hidden_channels, num_heads, num_layers)
+    model.train(mode == "train")
+    nodes, edges, peaks = [], [], []
+
+    def step(data):
+        if mode == "train":
+            model(data).sum().backward()
+            model.zero_grad(set_to_none=True)
+        else:
+            with torch.no_grad():
+                model(data)
+
+    for n in sizes:
+        data = Batch.from_data_list([Data(x=torch.randn(n, in_channels), edge_index=_contact_graph(n),
+                                          y=torch.rand(1))]).to(device)
+        step(data)  # warm-up: allocator pools and lazily created buffers
+        for _ in range(repeats):
+            with PeakMemory(device) as mem:
+                step(data)
+            nodes.append(n)
+            # GATConv adds one self-loop per node; _contact_graph already contains them
+            edges.append(data.num_edges)
+            peaks.append(mem.peak)
+    return CostModel.fit(nodes, edges, peaks), (nodes, edges, peaks)
+
+
+def step_times(model, loader, max_steps=None):
+    """Wall time of every training step over loader, with the graphs and nodes of each batch."""
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-5)
+    criterion = torch.nn.MSELoss(reduction="sum")
+    model.train()
+    times, graphs, nodes = [], [], []
+    for data in loader:
+        start = time.perf_counter()
+        optimizer.zero_grad()
+        loss = criterion(model(data).float().reshape(-1), data.y.float())
+        loss.backward()
+        optimizer.step()
+        loss.item()
+        times.append(time.perf_counter() - start)
+        graphs.append(data.num_graphs)
+        nodes.append(data.num_nodes)
+        if len(times) == max_steps:
+            break
+    return np.array(times), np.array(graphs), np.array(nodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the GATClassifier memory cost model on this machine, or compare "
+                                                 "fixed-size and node-budget batches.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cal = sub.add_parser("calibrate", help="Measure peak memory per graph size and fit the cost model")
+    cal.add_argument("--mode", choices=["train", "inference"], default="train")
+    cal.add_argument("--out", required=True, help="Where to write the fitted cost model (JSON)")
+    cal.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200, 400, 600, 800], help="Residues per synthetic graph")
+    cal.add_argument("--repeats", type=int, default=2)
+    steps = sub.add_parser("steps", help="Step-time variance and throughput: fixed batch size vs BucketBatchSampler")
+    steps.add_argument("--dataset", default=None, help="Pickled dataset or a gatsol_mmap.py directory")
+    steps.add_argument("--split", default="train")
+    steps.add_argument("--batch_size", type=int, default=4, help="Graphs per batch of the fixed-size baseline")
+    steps.add_argument("--max_nodes", type=int, nargs="+", required=True, help="Node budgets to compare")
+    steps.add_argument("--max_edges", type=int, default=None)
+    steps.add_argument("--pool_size", type=int, default=256)
+    steps.add_argument("--epochs", type=int, default=2, help="Epochs per configuration; the first is warm-up")
+    for p in (cal, steps):
+        p.add_argument("--hidden_channels", type=int, default=HIDDEN_CHANNELS)
+        p.add_argument("--num_heads", type=int, default=NUM_HEADS)
+        p.add_argument("--num_layers", type=int, default=NUM_LAYERS)
+        p.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    if args.command == "steps":
+        import gatsol_eval
+        from gatsol_adjacency import prepare_dataset
+        from gatsol_loader import make_loader
+        from gatsol_model import build_model
+
+        dataset = gatsol_eval.load_split(args.dataset or gatsol_eval.DEFAULT_DATASET, args.split)
+        if isinstance(dataset, list):
+            dataset = prepare_dataset(dataset)
+        configs = [(f"batch_size {args.batch_size}", None)]
+        configs += [(f"max_nodes {n}", BucketBatchSampler(dataset, n, args.max_edges, args.pool_size, seed=2024))
+                    for n in args.max_nodes]
+        print(f"{'batches':<16} {'steps':>6} {'graphs':>7} {'nodes':>7} {'step ms':>8} {'std ms':>7} {'CV':>5} "
+              f"{'p95 ms':>7} {'graphs/s':>9} {'nodes/s':>9}")
+        for name, sampler in configs:
+            torch.manual_seed(2024)
+            model = build_model(args.device, IN_CHANNELS, args.hidden_channels, args.num_heads, args.num_layers)
+            if sampler is None:
+                loader = make_loader(dataset, args.device, args.batch_size, shuffle=True, num_workers=0)
+            else:
+                loader = make_loader(dataset, args.device, batch_sampler=sampler, num_workers=0)
+            for _ in range(args.epochs):
+                # the last epoch is reported; earlier ones warm up the allocator and kernels
+                times, graphs, nodes = step_times(model, loader)
+            print(f"{name:<16} {len(times):>6} {graphs.mean():>7.1f} {nodes.mean():>7.0f} {1e3 * times.mean():>8.1f} "
+                  f"{1e3 * times.std():>7.1f} {times.std() / times.mean():>5.2f} "
+                  f"{1e3 * np.percentile(times, 95):>7.1f} {graphs.sum() / times.sum():>9.1f} "
+                  f"{nodes.sum() / times.sum():>9.0f}")
+        return
+
+    model, (nodes, edges, peaks) = calibrate(args.mode, args.sizes, args.device, IN_CHANNELS, args.hidden_channels,
+                                             args.num_heads, args.num_layers, args.repeats)
+    analytic = CostModel.from_config(IN_CHANNELS, args.hidden_channels, args.num_heads, args.num_layers,
+                                     training=args.mode == "train")
+    print(f"{'nodes':>6} {'edges':>8} {'measured MB':>12} {'fitted MB':>10} {'config MB':>10}")
+    for n, e, peak in zip(nodes, edges, peaks):
+        print(f"{n:>6} {e:>8} {peak / 2 ** 20:>12.1f} {model.batch_bytes([(n, e)]) / 2 ** 20:>10.1f} "
+              f"{analytic.batch_bytes([(n, e)]) / 2 ** 20:>10.1f}")
+    print(f"fitted: {model}")
+    print(f"from config: {analytic}")
+    model.save(args.out)
+    print(f"Written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
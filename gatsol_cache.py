@@ -0,0 +1,94 @@
+"""
+Persistent GATSol result cache
+- Key: sequence hash + structure-content hash + contact threshold + model checkpoint hash
+- SQLite file, bounded to max_entries with least-recently-used eviction
+"""
+import os
+import time
+import sqlite3
+import hashlib
+
+import numpy as np
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def structure_hash(structure):
+    """Hash of the structure content: a PDB path (file bytes), PDB text or a coordinate array."""
+    if isinstance(structure, np.ndarray):
+        return sha256_bytes(np.ascontiguousarray(structure, dtype=np.float64).tobytes())
+    if os.path.isfile(structure):
+        return file_sha256(structure)
+    return sha256_bytes(structure.encode())
+
+
+def make_key(sequence, structure_digest, threshold, model_digest):
+    parts = (sha256_bytes(sequence.upper().encode()), structure_digest, repr(float(threshold)), model_digest)
+    return sha256_bytes("|".join(parts).encode())
+
+
+class ResultCache:
+    def __init__(self, path, max_entries=1_000_000):
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, score REAL, last_used REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS checkpoints "
+                          "(path TEXT PRIMARY KEY, size INTEGER, mtime REAL, digest TEXT)")
+        self.conn.commit()
+
+    def model_digest(self, checkpoint):
+        """sha256 of a checkpoint, re-hashed only when its size or mtime changed."""
+        path = os.path.abspath(checkpoint)
+        stat = os.stat(path)
+        row = self.conn.execute("SELECT size, mtime, digest FROM checkpoints WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+        digest = file_sha256(path)
+        self.conn.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)",
+                          (path, stat.st_size, stat.st_mtime, digest))
+        self.conn.commit()
+        return digest
+
+    def get_many(self, keys):
+        """Return {key: score} for the keys present, and mark them as recently used."""
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(self.conn.execute(
+                f"SELECT key, score FROM results WHERE key IN ({placeholders})", chunk).fetchall())
+        now = time.time()
+        self.conn.executemany("UPDATE results SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+        self.conn.commit()
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        self.conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                              [(key, float(score), now) for key, score in items])
+        self._evict()
+        self.conn.commit()
+
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute("DELETE FROM results WHERE key IN "
+                              "(SELECT key FROM results ORDER BY last_used ASC LIMIT ?)", (count - self.max_entries,))
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
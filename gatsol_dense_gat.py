@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Dense masked-attention GAT layer for small protein graphs
+- DenseGATConv is a GATConv subclass: same parameters, loads best_model.pt unchanged
+- Graphs with at most dense_threshold nodes are processed as one batched dense
+  masked softmax over the contact adjacency; larger ones fall back to the sparse path
+- The benchmark compares both paths per graph size, to locate the crossover and
+  check numerical equivalence
+
+Usage:
+    python gatsol_dense_gat.py --sizes 50 100 200 400 600 800 1200 --repeats 3
+"""
+import time
+import argparse
+import torch
+import torch.nn.functional as F
+from torch_geometric.nn import GATConv
+from torch_geometric.utils import to_dense_adj, to_dense_batch, add_self_loops
+
+from gatsol_model import IN_CHANNELS, HIDDEN_CHANNELS, NUM_HEADS, NUM_LAYERS, build_model, projection_name
+
+DENSE_THRESHOLD = 1024
+
+
+class DenseGATConv(GATConv):
+    # GATClassifier passes the batch vector to layers that set this flag
+    uses_batch = True
+
+    def __init__(self, *args, dense_threshold=DENSE_THRESHOLD, **kwargs):
+        super(DenseGATConv, self).__init__(*args, **kwargs)
+        self.dense_threshold = dense_threshold
+
+    def forward(self, x, edge_index, edge_attr=None, size=None, return_attention_weights=None, batch=None):
+        if (edge_attr is not None or return_attention_weights is not None or not isinstance(x, torch.Tensor)
+                or not isinstance(edge_index, torch.Tensor)):
+            return super().forward(x, edge_index, edge_attr, size, return_attention_weights)
+        if batch is None:
+            batch = x.new_zeros(x.size(0), dtype=torch.long)
+        max_nodes = int(torch.bincount(batch).max()) if batch.numel() else 0
+        if max_nodes > self.dense_threshold:
+            return super().forward(x, edge_index)
+        return self._dense_forward(x, edge_index, batch, max_nodes)
+
+    def _dense_forward(self, x, edge_index, batch, max_nodes):
+        H, C = self.heads, self.out_channels
+        h = getattr(self, projection_name(self))(x).view(-1, H, C)
+        alpha_src = (h * self.att_src).sum(dim=-1)
+        alpha_dst = (h * self.att_dst).sum(dim=-1)
+
+        h_dense, mask = to_dense_batch(h, batch, max_num_nodes=max_nodes)  # [B, N, H, C]
+        src_dense, _ = to_dense_batch(alpha_src, batch, max_num_nodes=max_nodes)  # [B, N, H]
+        dst_dense, _ = to_dense_batch(alpha_dst, batch, max_num_nodes=max_nodes)
+        # adj[b, i, j]: edge j -> i, i.e. node i attends to node j
+        adj = to_dense_adj(edge_index, batch, max_num_nodes=max_nodes).transpose(1, 2) > 0
+        eye = torch.eye(max_nodes, dtype=torch.bool, device=x.device)
+        if self.add_self_loops:
+            # GATConv drops existing self-loops and adds exactly one per node
+            adj = (adj & ~eye) | eye
+        else:
+            # padding rows still need one finite entry to keep the softmax NaN-free
+            adj = adj | (eye & ~mask.unsqueeze(-1))
+
+        scores = dst_dense.permute(0, 2, 1).unsqueeze(-1) + src_dense.permute(0, 2, 1).unsqueeze(-2)  # [B, H, N, N]
+        scores = F.leaky_relu(scores, self.negative_slope)
+        scores = scores.masked_fill(~adj.unsqueeze(1), float("-inf"))
+        alpha = torch.softmax(scores, dim=-1)
+        alpha = F.dropout(alpha, p=self.dropout, training=self.training)
+
+        out = torch.matmul(alpha, h_dense.permute(0, 2, 1, 3))  # [B, H, N, C]
+        out = out.permute(0, 2, 1, 3)[mask]  # [num_nodes, H, C]
+        if self.concat:
+            out = out.reshape(-1, H * C)
+        else:
+            out = out.mean(dim=1)
+        if getattr(self, "res", None) is not None:
+            out = out + self.res(x)
+        if self.bias is not None:
+            out = out + self.bias
+        return out
+
+
+def densify_model(model, dense_threshold=DENSE_THRESHOLD):
+    """Swap every GATConv of a GATClassifier for a DenseGATConv holding the same weights."""
+    for i, conv in enumerate(model.convs):
+        dense = DenseGATConv(conv.in_channels, conv.out_channels, heads=conv.heads, concat=conv.concat,
+                             negative_slope=conv.negative_slope, dropout=conv.dropout,
+                             add_self_loops=conv.add_self_loops, bias=conv.bias is not None,
+                             dense_threshold=dense_threshold)
+        dense.load_state_dict(conv.state_dict())
+        model.convs[i] = dense.to(next(conv.parameters()).device)
+    return model
+
+
+def _contact_graph(num_nodes, threshold=10.0):
+    # CA trace as a random walk with 3.8 Å steps, contacts below threshold as in pdb_to_cm
+    steps = torch.randn(num_nodes, 3)
+    coords = (steps / steps.norm(dim=1, keepdim=True) * 3.8).cumsum(0)
+    i, j = torch.nonzero(torch.triu(torch.cdist(coords, coords) < threshold, diagonal=1), as_tuple=True)
+    edge_index, _ = add_self_loops(torch.stack([i, j]), num_nodes=num_nodes)
+    return edge_index
+
+
+def _time(model, data, repeats):
+    with torch.no_grad():
+        model(data)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            out = model(data)
+        if data.x.is_cuda:
+            torch.cuda.synchronize()
+    return (time.perf_counter() - start) * 1000 / repeats, out
+
+
+def main():
+    from torch_geometric.data import Batch, Data
+
+    parser = argparse.ArgumentParser(description="Benchmark dense vs sparse GAT attention per graph size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200, 400, 600, 800, 1200, 1600])
+    parser.add_argument("--batch_size", type=int, default=1, help="Graphs of the same size per forward pass")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--hidden_channels", type=int, default=HIDDEN_CHANNELS)
+    parser.add_argument("--num_heads", type=int, default=NUM_HEADS)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    torch.manual_seed(2024)
+    sparse = build_model(args.device, IN_CHANNELS, args.hidden_channels, args.num_heads, NUM_LAYERS).eval()
+    dense = densify_model(build_model(args.device, IN_CHANNELS, args.hidden_channels, args.num_heads, NUM_LAYERS),
+                          dense_threshold=max(args.sizes)).eval()
+    dense.load_state_dict(sparse.state_dict())
+
+    print(f"{'nodes':>6} {'edges':>8} {'sparse ms':>10} {'dense ms':>10} {'speedup':>8} {'max |diff|':>11}")
+    for n in args.sizes:
+        graphs = [Data(x=torch.randn(n, IN_CHANNELS), edge_index=_contact_graph(n)) for _ in range(args.batch_size)]
+        data = Batch.from_data_list(graphs).to(args.device)
+        sparse_ms, sparse_out = _time(sparse, data, args.repeats)
+        dense_ms, dense_out = _time(dense, data, args.repeats)
+        diff = (sparse_out - dense_out).abs().max().item()
+        print(f"{n:>6} {data.num_edges // args.batch_size:>8} {sparse_ms:>10.2f} {dense_ms:>10.2f} "
+              f"{sparse_ms / dense_ms:>7.2f}x {diff:>11.2e}")
+
+
+if __name__ == "__main__":
+    main()
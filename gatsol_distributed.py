@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Data-parallel GATSol training on CPU cores and nodes (torch.distributed, gloo backend)
+- init_distributed: joins the process group torchrun sets up (RANK, WORLD_SIZE and
+  MASTER_ADDR in the environment); a plain single-process run is left untouched
+- Training graphs are sharded across ranks by a DistributedSampler (or the rank's share of the
+  memory-budget batches), DistributedDataParallel all-reduces the gradients
+- The CLI compares the --metrics_out files of re_train.py runs with 1..N processes
+
+Usage:
+    torchrun --nproc_per_node 8 re_train.py --dataset dataset/GATSol_mmap --metrics_out ddp8.json
+    python gatsol_distributed.py --metrics ddp1.json ddp2.json ddp4.json ddp8.json
+"""
+import os
+import json
+import argparse
+import torch
+import torch.distributed as dist
+
+
+def init_distributed(backend="gloo"):
+    """(rank, world_size); joins the process group when launched by torchrun."""
+    if int(os.environ.get("WORLD_SIZE", 1)) <= 1:
+        return 0, 1
+    dist.init_process_group(backend)
+    return dist.get_rank(), dist.get_world_size()
+
+
+def wrap_model(model, world_size):
+    """DistributedDataParallel wrapper for the training passes (the model itself when single-process)."""
+    if world_size <= 1:
+        return model
+    from torch.nn.parallel import DistributedDataParallel
+    return DistributedDataParallel(model)
+
+
+def barrier(world_size):
+    if world_size > 1:
+        dist.barrier()
+
+
+def all_reduce_sum(value, world_size):
+    """Sum of a float (or a tensor, returned on the CPU) over all ranks."""
+    if world_size <= 1:
+        return value
+    if torch.is_tensor(value):
+        total = value.detach().cpu().clone()
+        dist.all_reduce(total)
+        return total
+    total = torch.tensor([value], dtype=torch.float64)
+    dist.all_reduce(total)
+    return float(total)
+
+
+def scaling_report(runs):
+    """Rows of (processes, graphs/s, speed-up, efficiency) relative to the smallest run."""
+    runs = sorted(runs, key=lambda r: r["world_size"])
+    base = runs[0]["graphs_per_s"] / runs[0]["world_size"]
+    return [(r["world_size"], r["graphs_per_s"], r["graphs_per_s"] / runs[0]["graphs_per_s"],
+             r["graphs_per_s"] / (base * r["world_size"])) for r in runs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling efficiency of data-parallel re_train.py runs.")
+    parser.add_argument("--metrics", nargs="+", required=True, help="re_train.py --metrics_out files, one per process count")
+    args = parser.parse_args()
+
+    runs = []
+    for path in args.metrics:
+        with open(path) as f:
+            runs.append(json.load(f))
+    print(f"{'processes':>9}  {'graphs/s':>9}  {'speed-up':>8}  {'efficiency':>10}")
+    for world_size, rate, speedup, efficiency in scaling_report(runs):
+        print(f"{world_size:>9}  {rate:>9.1f}  {speedup:>7.2f}x  {100 * efficiency:>9.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Evaluation helpers shared by the model tooling (quantization, compression, benchmarks)
+- load_split: read one split of dataset/GATSol_datasets.pkl (or of its gatsol_mmap.py conversion)
+- predict: run a model over a loader and collect predictions on the CPU
+- metrics / agreement: regression + binary metrics and model-vs-reference agreement
+- RunningMetrics: loss, R2 and Pearson accumulated during a training pass
+- EvalSchedule: full evaluation every k epochs and/or after a time budget
+- PeakMemory: peak CUDA allocation or process RSS growth inside a block
+"""
+import os
+import threading
+import time
+import numpy as np
+import torch
+from sklearn import metrics as skm
+from scipy.stats import pearsonr
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset", "GATSol_datasets.pkl")
+
+
+def load_split(path=DEFAULT_DATASET, split="test", limit=None):
+    if os.path.isdir(path):
+        # converted by gatsol_mmap.py
+        from gatsol_mmap import MemmapGraphDataset
+        dataset = MemmapGraphDataset(os.path.join(path, split))
+        return dataset if limit is None else [dataset[i] for i in range(min(limit, len(dataset)))]
+    with open(path, "rb") as f:
+        datasets = torch.load(f, map_location="cpu", weights_only=False)
+    dataset = datasets[split]
+    if limit is not None:
+        dataset = dataset[:limit]
+    return dataset
+
+
+def predict(model, loader, device="cpu"):
+    """Return (y_hat, y_true) as 1-D numpy arrays, one entry per graph."""
+    model.eval()
+    y_hat, y_true = [], []
+    with torch.no_grad():
+        for data in loader:
+            data = data.to(device)
+            output = model(data).float().reshape(-1)
+            y_hat.append(output.cpu())
+            y_true.append(data.y.float().reshape(-1).cpu())
+    return torch.cat(y_hat).numpy(), torch.cat(y_true).numpy()
+
+
+def metrics(y_true, y_hat, cut_off=0.5):
+    binary_true = (np.asarray(y_true) >= cut_off).astype(int)
+    binary_pred = (np.asarray(y_hat) >= cut_off).astype(int)
+    result = {
+        "R2": skm.r2_score(y_true, y_hat),
+        "Pearson": pearsonr(y_true, y_hat)[0],
+        "Accuracy": skm.accuracy_score(binary_true, binary_pred),
+    }
+    # AUC is undefined when the held-out subset only has one class
+    result["AUC"] = skm.roc_auc_score(binary_true, y_hat) if len(set(binary_true)) > 1 else float("nan")
+    return result
+
+
+def agreement(reference, other):
+    diff = np.abs(np.asarray(reference) - np.asarray(other))
+    return {
+        "MaxAbsDiff": float(diff.max()),
+        "MeanAbsDiff": float(diff.mean()),
+        "Pearson": pearsonr(reference, other)[0],
+    }
+
+
+class RunningMetrics:
+    """Loss (summed squared error per graph), R2 and Pearson from running sums, batch by batch.
+
+    The sums stay on the device of the predictions, so updating does not synchronize with a GPU.
+    Without any batch (e.g. a rank left with none) every metric is NaN.
+    """
+
+    def __init__(self):
+        self.sums = torch.zeros(7, dtype=torch.float64)  # n, squared error, y, y^2, y_hat, y_hat^2, y * y_hat
+
+    def update(self, y_hat, y_true):
+        y_hat = y_hat.detach().reshape(-1).double()
+        y_true = y_true.detach().reshape(-1).double()
+        batch = torch.stack([torch.tensor(float(y_true.numel()), dtype=torch.float64, device=y_true.device),
+                             ((y_hat - y_true) ** 2).sum(), y_true.sum(), (y_true ** 2).sum(),
+                             y_hat.sum(), (y_hat ** 2).sum(), (y_true * y_hat).sum()])
+        self.sums = self.sums.to(batch.device) + batch
+
+    def result(self):
+        n, sse, sy, syy, sp, spp, syp = self.sums.tolist()
+        if n == 0:
+            return {"Loss": float("nan"), "R2": float("nan"), "Pearson": float("nan")}
+        var_true, var_hat, cov = syy - sy * sy / n, spp - sp * sp / n, syp - sy * sp / n
+        return {
+            "Loss": sse / n,
+            "R2": 1 - sse / var_true if var_true > 0 else float("nan"),
+            "Pearson": cov / (var_true * var_hat) ** 0.5 if var_true > 0 and var_hat > 0 else float("nan"),
+        }
+
+
+class EvalSchedule:
+    """Decides after which epochs the full evaluation runs.
+
+    every: every k-th epoch; interval: once this many seconds have passed since the last
+    evaluation; with both, whichever comes first; with neither, every epoch. The last epoch
+    is always evaluated.
+    """
+
+    def __init__(self, every=None, interval=None, last_epoch=None):
+        self.every = every if every or interval else 1
+        self.interval = interval
+        self.last_epoch = last_epoch
+        self.mark()
+
+    def mark(self):
+        self._last = time.perf_counter()
+
+    def __call__(self, epoch):
+        return (epoch == self.last_epoch or bool(self.every) and epoch % self.every == 0
+                or self.interval is not None and time.perf_counter() - self._last >= self.interval)
+
+
+def format_metrics(values, digits=4):
+    return ", ".join(f"{k}: {v:.{digits}f}" for k, v in values.items())
+
+
+def state_dict_bytes(model):
+    """Serialized size of a model's state_dict, the on-disk / resident weight cost."""
+    import io
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def time_forward(model, loader, device="cpu", repeats=1):
+    """Mean wall time per graph in milliseconds (after one warm-up batch)."""
+    model.eval()
+    batches = [data.to(device) for data in loader]
+    with torch.no_grad():
+        model(batches[0])
+        if device != "cpu" and torch.cuda.is_available():
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for data in batches:
+                model(data)
+        if device != "cpu" and torch.cuda.is_available():
+            torch.cuda.synchronize()
+    num_graphs = sum(data.num_graphs for data in batches) * repeats
+    return (time.perf_counter() - start) * 1000 / num_graphs
+
+
+def _rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakMemory:
+    """Measure peak memory of the enclosed block.
+
+    On CUDA this is torch.cuda.max_memory_allocated; on the CPU the process RSS is
+    sampled from a background thread and the growth over the entry value is kept.
+    """
+
+    def __init__(self, device="cpu", interval=0.005):
+        self.cuda = str(device).startswith("cuda")
+        self.interval = interval
+        self.peak = 0
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes() - self._base)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        if self.cuda:
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            self._base = torch.cuda.memory_allocated()
+        else:
+            self._base = _rss_bytes()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.cuda:
+            torch.cuda.synchronize()
+            self.peak = torch.cuda.max_memory_allocated() - self._base
+        else:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, _rss_bytes() - self._base)
+        return False
+
+    @property
+    def peak_mb(self):
+        return self.peak / 2 ** 20
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Background-prefetching graph loader for training and the parameter sweeps
+- make_loader: DataLoader whose worker processes read and collate batches ahead of the
+  training loop, into pinned memory when training on CUDA (plain memory on CPU-only hosts)
+- DeviceLoader: moves each batch to the device as it is consumed (non-blocking from pinned
+  memory), so graphs no longer have to be moved to the GPU when the dataset is loaded
+- cached_loader: evaluation batches of a fixed split collated once, then replayed every epoch;
+  kept in memory or written to a cache directory and memory-mapped, so later sweep
+  configurations and runs over the same split reuse them
+- The CLI reports training steps/second of the old loop (graphs moved to the device up front,
+  collated on the main thread) against the prefetching loader, and the time an evaluation
+  pass spends collating
+
+Usage:
+    python gatsol_loader.py --dataset dataset/GATSol_datasets.pkl --num_workers 0 2 4
+"""
+import os
+import time
+import hashlib
+import weakref
+import argparse
+from collections import OrderedDict
+import torch
+from torch.utils.data import RandomSampler
+from torch_geometric.loader import DataLoader
+
+from gatsol_model import IN_CHANNELS, HIDDEN_CHANNELS, NUM_HEADS, NUM_LAYERS
+
+# torch.load(mmap=True) needs torch 2.1; older versions read cache files into memory
+TORCH_MMAP = tuple(int(v) for v in torch.__version__.split("+")[0].split(".")[:2]) >= (2, 1)
+
+
+def default_num_workers():
+    # workers only help when they do not take cores away from the training process
+    return max(0, min(2, (os.cpu_count() or 1) - 1))
+
+
+class DeviceLoader:
+    """Iterates a DataLoader and moves every batch to device."""
+
+    def __init__(self, loader, device):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.non_blocking = loader.pin_memory
+
+    @property
+    def dataset(self):
+        return self.loader.dataset
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for batch in self.loader:
+            yield batch.to(self.device, non_blocking=self.non_blocking)
+
+
+def make_loader(dataset, device, batch_size=1, shuffle=False, sampler=None, batch_sampler=None, num_workers=None,
+                prefetch_factor=2):
+    """DataLoader with num_workers background collation processes, wrapped in a DeviceLoader."""
+    num_workers = default_num_workers() if num_workers is None else num_workers
+    options = {"persistent_workers": True, "prefetch_factor": prefetch_factor} if num_workers else {}
+    if shuffle and sampler is None:
+        # own generator, seeded once from the global RNG: the DataLoader draws worker seeds from
+        # the global RNG a different number of times per epoch depending on num_workers
+        seed = int(torch.randint(2 ** 62, (1,)))
+        sampler = RandomSampler(dataset, generator=torch.Generator().manual_seed(seed))
+    if batch_sampler is None:
+        options.update(batch_size=batch_size, sampler=sampler)
+    loader = DataLoader(dataset, batch_sampler=batch_sampler, num_workers=num_workers,
+                        pin_memory=torch.device(device).type == "cuda", **options)
+    return DeviceLoader(loader, device)
+
+
+class CachedBatches:
+    """Replays batches collated once (on first use), moving each to device as it is consumed."""
+
+    def __init__(self, build, num_batches, dataset, device):
+        self._build = build
+        self._num_batches = num_batches
+        # test() divides by len(loader.dataset), as for the DataLoader this replaces
+        self.dataset = dataset
+        self.device = torch.device(device)
+
+    def __len__(self):
+        return self._num_batches
+
+    def __iter__(self):
+        for batch in self._build():
+            yield batch.to(self.device, non_blocking=self.device.type == "cuda")
+
+
+# collated splits of this process, least recently used first
+_CACHED = OrderedDict()
+MAX_CACHED_SPLITS = 8
+
+
+# content digest per in-memory graph, so a graph list is hashed once per process and not once
+# per loader (every fold of every sweep configuration builds a new loader over the same graphs)
+_GRAPH_DIGESTS = {}
+
+
+def _graph_digest(data):
+    entry = _GRAPH_DIGESTS.get(id(data))
+    if entry is not None and entry[0]() is data:
+        return entry[1]
+    digest = hashlib.blake2b(digest_size=12)
+    for key, value in data:
+        if torch.is_tensor(value) and value.layout == torch.strided:
+            digest.update(key.encode())
+            digest.update(value.contiguous().cpu().numpy().tobytes())
+    key = id(data)
+    _GRAPH_DIGESTS[key] = (weakref.ref(data, lambda _, key=key: _GRAPH_DIGESTS.pop(key, None)), digest.digest())
+    return _GRAPH_DIGESTS[key][1]
+
+
+def _split_key(dataset, batches):
+    digest = hashlib.blake2b(repr(batches).encode(), digest_size=12)
+    if hasattr(dataset, "split_dir"):
+        # gatsol_mmap split: identified by its location and conversion time
+        meta = os.path.join(os.path.abspath(dataset.split_dir), "meta.json")
+        digest.update(repr((meta, os.stat(meta).st_mtime_ns)).encode())
+    else:
+        for i in sorted({i for batch in batches for i in batch}):
+            digest.update(_graph_digest(dataset[i]))
+    return digest.hexdigest()
+
+
+def cached_loader(dataset, device, batch_size=1, indices=None, batch_sampler=None, cache_dir=None, num_workers=None):
+    """Evaluation loader whose batches are collated once per process and split.
+
+    Batches are dataset[indices] in order, batch_size at a time, or the index lists of a
+    (non-shuffling) batch_sampler. With cache_dir they are saved to <cache_dir>/<key>.pt and
+    memory-mapped from there (read into memory on torch < 2.1); the key is derived from the split's content and the batching,
+    so any run, script or sweep configuration evaluating the same batches reuses the file.
+    """
+    if batch_sampler is not None:
+        batches = [list(batch) for batch in batch_sampler]
+    else:
+        indices = list(range(len(dataset))) if indices is None else [int(i) for i in indices]
+        batches = [indices[i:i + batch_size] for i in range(0, len(indices), batch_size)]
+
+    key = None
+
+    def build():
+        nonlocal key
+        if key is None:
+            key = _split_key(dataset, batches)
+        if key not in _CACHED:
+            path = os.path.join(cache_dir, f"{key}.pt") if cache_dir else None
+            if path is None or not os.path.exists(path):
+                collated = list(make_loader(dataset, "cpu", batch_sampler=batches, num_workers=num_workers).loader)
+                if path is not None:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    torch.save(collated, tmp_path)
+                    os.replace(tmp_path, path)
+            if path is not None:
+                collated = torch.load(path, weights_only=False, **({"mmap": True} if TORCH_MMAP else {}))
+            elif torch.device(device).type == "cuda":
+                collated = [batch.pin_memory() for batch in collated]
+            _CACHED[key] = collated
+            if len(_CACHED) > MAX_CACHED_SPLITS:
+                _CACHED.popitem(last=False)
+        _CACHED.move_to_end(key)
+        return _CACHED[key]
+
+    return CachedBatches(build, len(batches), dataset, device)
+
+
+def _steps_per_second(model, loader, device, max_steps):
+    # returns (steps/s, fraction of the time spent waiting for the next batch)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-5)
+    criterion = torch.nn.MSELoss(reduction="sum")
+    model.train()
+    steps, waiting = 0, 0.0
+    start = time.perf_counter()
+    fetch_start = start
+    for data in loader:
+        data = data.to(device)
+        waiting += time.perf_counter() - fetch_start
+        optimizer.zero_grad()
+        loss = criterion(model(data).float().reshape(-1), data.y.float())
+        loss.backward()
+        optimizer.step()
+        loss.item()
+        steps += 1
+        if steps == max_steps:
+            break
+        fetch_start = time.perf_counter()
+    elapsed = time.perf_counter() - start
+    return steps / elapsed, waiting / elapsed
+
+
+def main():
+    import gatsol_eval
+    from gatsol_adjacency import prepare_dataset
+    from gatsol_model import build_model
+
+    parser = argparse.ArgumentParser(description="Training steps/second: eager device placement vs the prefetching loader.")
+    parser.add_argument("--dataset", default=gatsol_eval.DEFAULT_DATASET, help="Pickled dataset or a gatsol_mmap.py directory")
+    parser.add_argument("--split", default="train")
+    parser.add_argument("--batch_size", type=int, default=4)
+    parser.add_argument("--num_workers", type=int, nargs="+", default=[0, 2, 4], help="Worker counts to compare")
+    parser.add_argument("--steps", type=int, default=None, help="Stop each run after this many steps")
+    parser.add_argument("--hidden_channels", type=int, default=HIDDEN_CHANNELS)
+    parser.add_argument("--num_heads", type=int, default=NUM_HEADS)
+    parser.add_argument("--num_layers", type=int, default=NUM_LAYERS)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--eval_split", default="test", help="Split for the evaluation-collation comparison")
+    args = parser.parse_args()
+
+    dataset = gatsol_eval.load_split(args.dataset, args.split)
+    if isinstance(dataset, list):
+        dataset = prepare_dataset(dataset)
+
+    def run(name, loader):
+        torch.manual_seed(2024)
+        model = build_model(args.device, IN_CHANNELS, args.hidden_channels, args.num_heads, args.num_layers)
+        _steps_per_second(model, loader, args.device, 2)  # warm-up: workers, allocator, kernels
+        rate, waiting = _steps_per_second(model, loader, args.device, args.steps)
+        print(f"[{name}] {rate:.2f} steps/s, {100 * waiting:.0f}% of the time waiting for data")
+
+    # the old loop: every graph collated on the main thread from tensors already on the device
+    start = time.perf_counter()
+    resident = [dataset[i].to(args.device) for i in range(len(dataset))]
+    print(f"moving {len(resident)} graphs to {args.device} up front took {time.perf_counter() - start:.2f}s")
+    run("eager", DataLoader(resident, batch_size=args.batch_size, shuffle=True))
+    del resident
+    for workers in args.num_workers:
+        run(f"prefetch, {workers} workers", make_loader(dataset, args.device, args.batch_size, shuffle=True,
+                                                        num_workers=workers))
+
+    # evaluation passes: graphs collated every pass vs batches collated once
+    eval_dataset = gatsol_eval.load_split(args.dataset, args.eval_split)
+    if isinstance(eval_dataset, list):
+        eval_dataset = prepare_dataset(eval_dataset)
+    model = build_model(args.device, IN_CHANNELS, args.hidden_channels, args.num_heads, args.num_layers).eval()
+
+    def eval_pass(loader):
+        start = time.perf_counter()
+        with torch.no_grad():
+            for data in loader:
+                model(data)
+        return time.perf_counter() - start
+
+    def collate_pass(loader):
+        start = time.perf_counter()
+        for _ in loader:
+            pass
+        return time.perf_counter() - start
+
+    collated = make_loader(eval_dataset, args.device, args.batch_size, num_workers=0)
+    cached = cached_loader(eval_dataset, args.device, args.batch_size, num_workers=0)
+    build = collate_pass(cached)  # the first pass collates
+    eval_pass(cached)  # warm-up
+    collate, total = collate_pass(collated), eval_pass(collated)
+    replay, total_cached = collate_pass(cached), eval_pass(cached)
+    print(f"[{args.eval_split}] collating {len(eval_dataset)} graphs: {collate:.2f}s per pass "
+          f"({100 * collate / total:.0f}% of a {total:.2f}s evaluation pass); "
+          f"cached: {replay:.2f}s per pass, {total_cached:.2f}s evaluation pass, built once in {build:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Load generator for gatsol_server.py
+- Sends N single-protein /predict requests from C concurrent clients
+- Reports throughput and latency percentiles
+
+Usage:
+    python gatsol_loadgen.py --url http://127.0.0.1:8765 --concurrency 8 --requests 200 \
+        --list Predict/NEED_to_PREPARE/list.csv --pdb_dir Predict/NEED_to_PREPARE/pdb
+"""
+import os
+import json
+import time
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+NEED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Predict", "NEED_to_PREPARE")
+
+
+def load_payloads(list_csv, pdb_dir):
+    df = pd.read_csv(list_csv)
+    payloads = []
+    for sid, seq in zip(df["id"], df["sequence"]):
+        with open(os.path.join(pdb_dir, f"{sid}.pdb")) as f:
+            record = {"id": sid, "sequence": seq, "pdb": f.read()}
+        payloads.append(json.dumps({"records": [record]}).encode())
+    return payloads
+
+
+def send(url, payload):
+    request = urllib.request.Request(url + "/predict", data=payload, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure gatsol_server.py latency under concurrent load.")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="Server base URL")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="Total requests to send")
+    parser.add_argument("--list", default=os.path.join(NEED_DIR, "list.csv"), help="CSV with id,sequence columns")
+    parser.add_argument("--pdb_dir", default=os.path.join(NEED_DIR, "pdb"), help="Directory holding <id>.pdb")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.list, args.pdb_dir)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        latencies = list(pool.map(lambda i: send(args.url, payloads[i % len(payloads)]), range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    percentiles = ", ".join(f"p{p}: {np.percentile(latencies, p):.1f}" for p in (50, 90, 95, 99))
+    print(f"{args.requests} requests, concurrency {args.concurrency}: {args.requests / elapsed:.2f} req/s")
+    print(f"latency ms -> {percentiles}, max: {latencies.max():.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Low-rank compression of the GATClassifier projection weights
+- Factorises GATConv projections (by default the 16384 -> 16384 one of the second layer)
+  into two thin matrices via truncated SVD, at a fixed rank or an energy threshold
+- Reports parameter count, CPU latency and R2/AUC against the uncompressed model
+- The compressed checkpoint can be fine-tuned with: python re_train.py --lowrank <checkpoint>
+
+Usage:
+    python gatsol_lowrank.py --checkpoint check_point/best_model/best_model.pt \
+        --out check_point/best_model/best_model_lowrank.pt --energy 0.9
+"""
+import os
+import argparse
+import torch
+import torch.nn as nn
+from torch_geometric.loader import DataLoader
+
+import gatsol_eval
+from gatsol_model import DEFAULT_CHECKPOINT, build_model, load_model, projection_name
+
+DEFAULT_LOWRANK_CHECKPOINT = os.path.join(os.path.dirname(DEFAULT_CHECKPOINT), "best_model_lowrank.pt")
+
+
+class LowRankLinear(nn.Module):
+    """y = up(down(x)), a rank-r stand-in for an out x in Linear."""
+
+    def __init__(self, in_channels, out_channels, rank, bias=False):
+        super(LowRankLinear, self).__init__()
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.rank = rank
+        self.down = nn.Linear(in_channels, rank, bias=False)
+        self.up = nn.Linear(rank, out_channels, bias=bias)
+
+    def forward(self, x):
+        return self.up(self.down(x))
+
+
+def choose_rank(singular_values, rank=None, energy=None):
+    """Explicit rank, or the smallest rank keeping `energy` of the squared spectrum."""
+    if rank is not None:
+        return min(rank, singular_values.numel())
+    if energy is None:
+        raise ValueError("either rank or energy must be given")
+    cumulative = torch.cumsum(singular_values.double() ** 2, 0)
+    cumulative = cumulative / cumulative[-1]
+    return int(torch.searchsorted(cumulative, torch.tensor(energy, dtype=cumulative.dtype)).item()) + 1
+
+
+def factorize(linear, rank=None, energy=None, randomized=False):
+    """Return a LowRankLinear approximating `linear` (an nn.Linear or PyG Linear)."""
+    weight = linear.weight.detach().float()
+    if randomized:
+        if rank is None:
+            raise ValueError("randomized SVD needs an explicit rank")
+        U, S, V = torch.svd_lowrank(weight, q=min(rank + 16, min(weight.shape)), niter=4)
+        Vh = V.t()
+    else:
+        U, S, Vh = torch.linalg.svd(weight, full_matrices=False)
+    r = choose_rank(S, rank, energy)
+    root = S[:r].sqrt()
+    bias = getattr(linear, "bias", None)
+    lowrank = LowRankLinear(weight.shape[1], weight.shape[0], r, bias=bias is not None)
+    with torch.no_grad():
+        lowrank.down.weight.copy_(root.unsqueeze(1) * Vh[:r])
+        lowrank.up.weight.copy_(U[:, :r] * root.unsqueeze(0))
+        if bias is not None:
+            lowrank.up.bias.copy_(bias)
+    return lowrank.to(linear.weight.device)
+
+
+def _set_projection(conv, module):
+    name = projection_name(conv)
+    setattr(conv, name, module)
+    # drop the lin_dst alias (torch_geometric < 2.5) so the factors are stored once;
+    # it is only read for bipartite inputs
+    if name == "lin_src":
+        conv.lin_dst = None
+
+
+def compress_model(model, rank=None, energy=None, layers=(1,), randomized=False):
+    """Factorise the projections of the selected GATConv layers in place; returns {layer: rank}."""
+    ranks = {}
+    for i in layers:
+        conv = model.convs[i]
+        lowrank = factorize(getattr(conv, projection_name(conv)), rank, energy, randomized)
+        _set_projection(conv, lowrank)
+        ranks[i] = lowrank.rank
+    return ranks
+
+
+def lowrank_ranks(model):
+    return {i: getattr(conv, projection_name(conv)).rank for i, conv in enumerate(model.convs)
+            if isinstance(getattr(conv, projection_name(conv)), LowRankLinear)}
+
+
+def save_compressed(model, path):
+    torch.save({"ranks": lowrank_ranks(model), "state_dict": model.state_dict()}, path)
+
+
+def load_compressed(path=DEFAULT_LOWRANK_CHECKPOINT, device="cpu"):
+    checkpoint = torch.load(path, map_location=device)
+    model = build_model(device)
+    for i, rank in checkpoint["ranks"].items():
+        conv = model.convs[int(i)]
+        lin = getattr(conv, projection_name(conv))
+        _set_projection(conv, LowRankLinear(lin.in_channels, lin.out_channels, rank,
+                                            bias=lin.bias is not None).to(device))
+    model.load_state_dict(checkpoint["state_dict"])
+    model.eval()
+    return model
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Low-rank compress the GATConv projections of a GATSol checkpoint.")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="fp32 state_dict (best_model.pt)")
+    parser.add_argument("--out", default=DEFAULT_LOWRANK_CHECKPOINT, help="Where to write the compressed checkpoint")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--rank", type=int, help="Keep this many singular values")
+    group.add_argument("--energy", type=float, help="Keep the smallest rank holding this fraction of the spectrum energy")
+    parser.add_argument("--layers", type=int, nargs="+", default=[1], help="GATConv layers to factorise (default: the second)")
+    parser.add_argument("--randomized", action="store_true", help="Randomized SVD (requires --rank, much faster)")
+    parser.add_argument("--dataset", default=gatsol_eval.DEFAULT_DATASET, help="GATSol_datasets.pkl used for the report")
+    parser.add_argument("--split", default="test", help="Held-out split to evaluate on (test, val or val1)")
+    parser.add_argument("--limit", type=int, default=None, help="Only evaluate the first N graphs")
+    parser.add_argument("--no_eval", action="store_true", help="Only compress, skip the report")
+    args = parser.parse_args()
+
+    full = load_model(args.checkpoint, "cpu")
+    compressed = load_model(args.checkpoint, "cpu")
+    ranks = compress_model(compressed, args.rank, args.energy, args.layers, args.randomized)
+    save_compressed(compressed, args.out)
+    print(f"ranks: {ranks}, compressed model written to {args.out}")
+    print(f"parameters: {count_parameters(full):,} -> {count_parameters(compressed):,} "
+          f"({count_parameters(compressed) / count_parameters(full):.1%})")
+    if args.no_eval:
+        return
+
+    loader = DataLoader(gatsol_eval.load_split(args.dataset, args.split, args.limit), batch_size=1, shuffle=False)
+    results = {}
+    for name, model in (("full", full), ("lowrank", compressed)):
+        y_hat, y_true = gatsol_eval.predict(model, loader)
+        results[name] = y_hat
+        print(f"[{name}] {gatsol_eval.format_metrics(gatsol_eval.metrics(y_true, y_hat))}, "
+              f"latency: {gatsol_eval.time_forward(model, loader):.2f} ms/graph")
+    print(f"[lowrank vs full] {gatsol_eval.format_metrics(gatsol_eval.agreement(results['full'], results['lowrank']))}")
+
+
+if __name__ == "__main__":
+    main()
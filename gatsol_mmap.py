@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped GATSol datasets
+- convert: one-off conversion of dataset/GATSol_datasets.pkl into one directory per split;
+  every graph attribute is concatenated into a .npy file with a pointer array per graph
+- MemmapGraphDataset: reads graphs lazily from the memory-mapped arrays, so training starts
+  without unpickling every graph and resident memory is bounded by the pages in use
+- Edges are stored with self-loops already normalised (gatsol_adjacency.prepare_graph);
+  adj_t is rebuilt per graph on access (when GATConv can use it, see gatsol_adjacency)
+
+Usage:
+    python gatsol_mmap.py --dataset dataset/GATSol_datasets.pkl --out dataset/GATSol_mmap
+    python re_train.py --dataset dataset/GATSol_mmap
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from torch_geometric.data import Data
+
+from gatsol_adjacency import CSR_AVAILABLE, _adj_t, prepare_graph
+
+
+def _split_keys(graphs):
+    first = graphs[0]
+    tensors = {key: first.__cat_dim__(key, value) for key, value in first
+               if torch.is_tensor(value) and key != "adj_t"}
+    extra = [key for key, value in first if not torch.is_tensor(value) and key != "adj_t"]
+    return tensors, extra
+
+
+def convert_split(graphs, out_dir):
+    """Write one split: <key>.npy (attributes concatenated along their PyG cat dim),
+    <key>.ptr.npy (per-graph offsets) and meta.json."""
+    os.makedirs(out_dir, exist_ok=True)
+    for data in graphs:
+        # edges normalised in place, one graph at a time; adj_t is rebuilt on access, so the
+        # split never holds a cached adjacency next to its edge_index
+        prepare_graph(data)
+        if "adj_t" in data:
+            del data.adj_t
+    tensors, extra = _split_keys(graphs)
+    meta = {"num_graphs": len(graphs), "tensors": {}, "extra": {key: [data[key] for data in graphs] for key in extra}}
+    for key, dim in tensors.items():
+        values = [data[key] for data in graphs]
+        sizes = [v.size(dim) for v in values]
+        ptr = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        shape = list(values[0].shape)
+        shape[dim] = int(ptr[-1])
+        # written slice by slice into the memory map, without concatenating the split in memory
+        out = np.lib.format.open_memmap(os.path.join(out_dir, f"{key}.npy"), mode="w+",
+                                        dtype=values[0].numpy().dtype, shape=tuple(shape))
+        for value, start, end in zip(values, ptr[:-1], ptr[1:]):
+            index = [slice(None)] * len(shape)
+            index[dim] = slice(start, end)
+            out[tuple(index)] = value.numpy()
+        out.flush()
+        del out
+        np.save(os.path.join(out_dir, f"{key}.ptr.npy"), ptr)
+        meta["tensors"][key] = dim
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return len(graphs)
+
+
+class MemmapGraphDataset(Dataset):
+    """Graphs of one converted split, read from memory-mapped arrays on access."""
+
+    def __init__(self, split_dir, adjacency=True):
+        self.split_dir = split_dir
+        self.adjacency = adjacency
+        with open(os.path.join(split_dir, "meta.json")) as f:
+            meta = json.load(f)
+        self.num_graphs = meta["num_graphs"]
+        self.cat_dims = meta["tensors"]
+        self.extra = meta["extra"]
+        self.ptrs = {key: np.load(os.path.join(split_dir, f"{key}.ptr.npy")) for key in self.cat_dims}
+        self._arrays = None
+
+    def __getstate__(self):
+        # DataLoader workers re-open the maps instead of receiving a pickled copy of the data
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = {key: np.load(os.path.join(self.split_dir, f"{key}.npy"), mmap_mode="r")
+                            for key in self.cat_dims}
+        return self._arrays
+
+    def __len__(self):
+        return self.num_graphs
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.num_graphs
+        data = Data()
+        for key, dim in self.cat_dims.items():
+            ptr = self.ptrs[key]
+            index = [slice(None)] * self.arrays[key].ndim
+            index[dim] = slice(ptr[i], ptr[i + 1])
+            data[key] = torch.from_numpy(np.array(self.arrays[key][tuple(index)]))
+        for key, values in self.extra.items():
+            data[key] = values[i]
+        if self.adjacency and CSR_AVAILABLE:
+            data.adj_t = _adj_t(data.edge_index, data.num_nodes)
+        return data
+
+    def graph_sizes(self):
+        """(nodes, edges) per graph from the pointer arrays, without reading any graph."""
+        nodes = np.diff(self.ptrs["x"])
+        edges = np.diff(self.ptrs["edge_index"])
+        return list(zip(nodes.tolist(), edges.tolist()))
+
+
+def open_datasets(root, adjacency=True):
+    """{split: MemmapGraphDataset} for every split converted under root."""
+    return {split: MemmapGraphDataset(os.path.join(root, split), adjacency) for split in sorted(os.listdir(root))
+            if os.path.exists(os.path.join(root, split, "meta.json"))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a pickled GATSol dataset into memory-mapped splits.")
+    parser.add_argument("--dataset", required=True, help="Pickled dict of graph lists, e.g. dataset/GATSol_datasets.pkl")
+    parser.add_argument("--out", required=True, help="Output directory, one sub-directory per split")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with open(args.dataset, "rb") as f:
+        datasets = torch.load(f, weights_only=False)
+    for split, graphs in datasets.items():
+        print(f"{split}: {convert_split(graphs, os.path.join(args.out, split))} graphs")
+        datasets[split] = None  # release each split once written
+    print(f"Written to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
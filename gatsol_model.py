@@ -0,0 +1,85 @@
+"""
+GATSol model definition shared by the training, prediction and tooling scripts
+- GATClassifier: the GAT regressor trained by re_train.py and served by Predict.py
+- build_model / load_model: construct the production configuration and load checkpoints
+- checkpoint_activations: recompute each GATConv layer during backward instead of keeping
+  its activations, for deeper/wider configurations or larger batches in the same memory
+"""
+import os
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
+from torch_geometric.nn import GATConv, global_mean_pool
+
+from gatsol_adjacency import adjacency
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CHECKPOINT = os.path.join(ROOT_DIR, "check_point", "best_model", "best_model.pt")
+
+# production configuration of best_model.pt
+IN_CHANNELS = 1300  # 输入特征的维度 (BLOSUM62 20 + ESM-1b 1280)
+HIDDEN_CHANNELS = 1024  # 隐层特征的维度
+NUM_HEADS = 16  # 注意力头的数量
+NUM_LAYERS = 2  # 网络层数
+
+
+def conv_layer(conv, x, adj, batch=None, checkpointed=False):
+    """relu(conv(x, adj)); checkpointed keeps only x for backward and recomputes the layer."""
+    def run(x):
+        if getattr(conv, "uses_batch", False):
+            # gatsol_dense_gat.DenseGATConv groups nodes per graph
+            return F.relu(conv(x, adj, batch=batch))
+        return F.relu(conv(x, adj))
+    if checkpointed and torch.is_grad_enabled():
+        return checkpoint(run, x, use_reentrant=False)
+    return run(x)
+
+
+# 定义图神经网络模型
+class GATClassifier(nn.Module):
+    def __init__(self, in_channels, hidden_channels, num_heads, num_layers, checkpoint_activations=False):
+        super(GATClassifier, self).__init__()
+        self.checkpoint_activations = checkpoint_activations  # 逐层重计算激活，以时间换显存
+        self.convs = nn.ModuleList()
+        for i in range(num_layers):
+            if i == 0:
+                self.convs.append(GATConv(in_channels, hidden_channels, heads=num_heads))
+            else:
+                self.convs.append(GATConv(hidden_channels * num_heads, hidden_channels, heads=num_heads))
+        self.lin1 = nn.Linear(hidden_channels * num_heads, 128)
+        self.lin2 = nn.Linear(128, 1)
+
+    def forward(self, data):
+        x, batch = data.x, data.batch
+        adj = adjacency(data)  # cached CSR adjacency from gatsol_adjacency, if present
+        for conv in self.convs:
+            x = conv_layer(conv, x, data.edge_index if getattr(conv, "uses_batch", False) else adj, batch,
+                           self.checkpoint_activations and self.training)
+        x = global_mean_pool(x, batch)
+        x = F.relu(self.lin1(x))
+        x = self.lin2(x)
+        return x.squeeze()
+
+
+def projection_name(conv):
+    """Attribute of a GATConv holding its (shared source/target) input projection.
+
+    torch_geometric < 2.5 stores it as ``lin_src`` (with ``lin_dst`` aliasing the
+    same module), newer releases as ``lin``.
+    """
+    if getattr(conv, "lin", None) is not None:
+        return "lin"
+    return "lin_src"
+
+
+def build_model(device="cpu", in_channels=IN_CHANNELS, hidden_channels=HIDDEN_CHANNELS,
+                num_heads=NUM_HEADS, num_layers=NUM_LAYERS, checkpoint_activations=False):
+    return GATClassifier(in_channels, hidden_channels, num_heads, num_layers, checkpoint_activations).to(device)
+
+
+def load_model(path=DEFAULT_CHECKPOINT, device="cpu"):
+    model = build_model(device)
+    model.load_state_dict(torch.load(path, map_location=device))
+    model.eval()
+    return model
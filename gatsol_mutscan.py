@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Saturation mutagenesis: GATSol scores for all 19 x L single-point mutants of a design
+- The structure is parsed and the contact graph built once; every mutant shares it
+- ESM-1b runs batched over mutant sequences; BLOSUM62 only changes in the mutated row
+- Mutant graphs are scored in batches bounded by a total node count
+- Output is a position x amino-acid matrix (the wild-type column holds the wild-type score)
+
+Usage:
+    python gatsol_mutscan.py --pdb Predict/NEED_to_PREPARE/pdb/mbp.pdb --sequence AIEEGK... --out mbp_scan.csv
+"""
+import time
+import argparse
+import pandas as pd
+import torch
+from torch_geometric.data import Batch, Data
+from Bio import SeqIO
+
+from gatsol_adjacency import prepare_graph
+from gatsol_model import DEFAULT_CHECKPOINT
+from gatsol_pipeline import AMINO_ACIDS, CONTACT_THRESHOLD, GATSolPipeline, build_graph, contact_edges, read_ca_coords
+
+
+def parse_positions(spec, length):
+    """1-based positions from "1-50,72,90-100"; all positions when spec is None."""
+    if not spec:
+        return list(range(1, length + 1))
+    positions = []
+    for part in spec.split(","):
+        start, _, end = part.partition("-")
+        positions.extend(range(int(start), int(end or start) + 1))
+    if any(p < 1 or p > length for p in positions):
+        raise ValueError(f"Positions must lie within 1..{length}")
+    return sorted(set(positions))
+
+
+def single_mutants(sequence, positions):
+    """[(name, position, amino acid, mutant sequence), ...] for every substitution at positions."""
+    return [(f"{sequence[p - 1]}{p}{aa}", p, aa, sequence[:p - 1] + aa + sequence[p:])
+            for p in positions for aa in AMINO_ACIDS if aa != sequence[p - 1]]
+
+
+def node_budget_batches(graphs, max_nodes):
+    """Consecutive groups of graphs whose total node count stays within max_nodes."""
+    batch, nodes = [], 0
+    for data in graphs:
+        if batch and nodes + data.num_nodes > max_nodes:
+            yield batch
+            batch, nodes = [], 0
+        batch.append(data)
+        nodes += data.num_nodes
+    if batch:
+        yield batch
+
+
+class MutationalScan:
+    def __init__(self, pipeline, max_batch_nodes=2048, chunk_size=64):
+        self.pipeline = pipeline
+        self.max_batch_nodes = max_batch_nodes
+        self.chunk_size = chunk_size
+        self.num_mutants = 0
+
+    def _score(self, graphs):
+        scores = []
+        with self.pipeline._timed("gat"), torch.no_grad():
+            for group in node_budget_batches(graphs, self.max_batch_nodes):
+                output = self.pipeline.model(Batch.from_data_list(group).to(self.pipeline.device))
+                scores.extend(output.reshape(-1).float().cpu().tolist())
+        return scores
+
+    def run(self, name, sequence, structure, positions=None):
+        """Return (wild-type score, DataFrame indexed by position with columns wt + 20 amino acids)."""
+        pipeline, features = self.pipeline, self.pipeline.features
+        sequence = sequence.upper()
+        with pipeline._timed("contacts"):
+            coords = read_ca_coords(structure)
+            # same check as GATSolPipeline.featurize: contacts index the sequence's residues
+            if len(coords) != len(sequence):
+                raise ValueError(f"{name}: structure has {len(coords)} CA atoms but the sequence has "
+                                 f"{len(sequence)} residues")
+            edges = contact_edges(coords, pipeline.threshold)
+        with pipeline._timed("blosum"):
+            wt_blosum = features.blosum62(sequence)
+            table = features.blosum_table()
+        with pipeline._timed("esm"):
+            wt_esm = features.esm([(name, sequence)])[0]
+        # edge_index / adj_t are built once and shared by every mutant graph
+        wt_graph = prepare_graph(build_graph(torch.cat((wt_blosum, wt_esm), 1), edges))
+        wt_score = self._score([wt_graph])[0]
+
+        mutants = single_mutants(sequence, parse_positions(positions, len(sequence)))
+        self.num_mutants = len(mutants)
+        scores = {}
+        for start in range(0, len(mutants), self.chunk_size):
+            chunk = mutants[start:start + self.chunk_size]
+            with pipeline._timed("esm"):
+                esm_features = features.esm([(mutant, seq) for mutant, _, _, seq in chunk])
+            graphs = []
+            with pipeline._timed("blosum"):
+                for (_, position, aa, _), esm in zip(chunk, esm_features):
+                    blosum = wt_blosum.clone()
+                    blosum[position - 1] = table[AMINO_ACIDS.index(aa)]
+                    graph = Data(x=torch.cat((blosum, esm), 1), edge_index=wt_graph.edge_index, y=wt_graph.y)
+                    if "adj_t" in wt_graph:
+                        graph.adj_t = wt_graph.adj_t
+                    graphs.append(graph)
+            for (_, position, aa, _), score in zip(chunk, self._score(graphs)):
+                scores[(position, aa)] = score
+
+        positions = sorted({position for _, position, _, _ in mutants})
+        matrix = pd.DataFrame(index=pd.Index(positions, name="position"), columns=["wt"] + list(AMINO_ACIDS), dtype=object)
+        for position in positions:
+            matrix.loc[position, "wt"] = sequence[position - 1]
+            for aa in AMINO_ACIDS:
+                matrix.loc[position, aa] = wt_score if aa == sequence[position - 1] else scores.get((position, aa))
+        return wt_score, matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every single-point mutant of a protein with GATSol.")
+    parser.add_argument("--pdb", required=True, help="Structure of the wild type (used for every mutant)")
+    sequence = parser.add_mutually_exclusive_group(required=True)
+    sequence.add_argument("--sequence", help="Wild-type sequence")
+    sequence.add_argument("--fasta", help="FASTA file holding the wild-type sequence (first record)")
+    parser.add_argument("--id", default="wt", help="Name used for the wild type")
+    parser.add_argument("--out", required=True, help="Position x amino-acid score matrix (CSV)")
+    parser.add_argument("--positions", default=None, help="1-based positions to scan, e.g. 1-50,72 (default: all)")
+    parser.add_argument("--max_batch_nodes", type=int, default=2048, help="Total residues per GAT forward pass")
+    parser.add_argument("--chunk_size", type=int, default=64, help="Mutants featurized at a time")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="GATClassifier state_dict")
+    parser.add_argument("--quantized", default=None, help="Use an int8 checkpoint from gatsol_quantize.py instead")
+    parser.add_argument("--threshold", type=float, default=CONTACT_THRESHOLD, help="Contact distance threshold in angstrom")
+    parser.add_argument("--esm_batch_size", type=int, default=8, help="Sequences per ESM forward pass")
+    args = parser.parse_args()
+
+    name, wt = args.id, args.sequence
+    if args.fasta:
+        record = next(SeqIO.parse(args.fasta, "fasta"))
+        name, wt = record.id, str(record.seq)
+
+    start = time.perf_counter()
+    pipeline = GATSolPipeline(args.checkpoint, threshold=args.threshold, quantized=args.quantized,
+                              esm_batch_size=args.esm_batch_size)
+    scan = MutationalScan(pipeline, args.max_batch_nodes, args.chunk_size)
+    wt_score, matrix = scan.run(name, wt, args.pdb, args.positions)
+    matrix.to_csv(args.out)
+    timings = ", ".join(f"{stage}: {seconds:.2f}s" for stage, seconds in pipeline.timings.items())
+    print(f"{name}: wild-type score {wt_score:.4f}, {scan.num_mutants} mutants scored in "
+          f"{time.perf_counter() - start:.2f}s ({timings}), written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
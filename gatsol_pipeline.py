@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Single-process GATSol prediction: (id, sequence, structure) -> solubility score
+- Same stages as Predict.sh (pdb_to_cm -> feature_extra -> Predict) in one interpreter
+- Models are loaded once; contact maps and graphs stay in memory
+- .cm / .pkl intermediates are only written when --keep_intermediates is given
+
+Usage:
+    python gatsol_pipeline.py --list Predict/NEED_to_PREPARE/list.csv \
+        --pdb_dir Predict/NEED_to_PREPARE/pdb --out Predict/Output.csv
+"""
+import os
+import io
+import sys
+import time
+import pickle
+import argparse
+import tempfile
+import contextlib
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+import torch
+from torch_geometric.data import Batch, Data
+from torch_geometric.loader import DataLoader
+from torch_geometric.utils import add_self_loops
+
+from gatsol_adjacency import prepare_graph
+from gatsol_model import ROOT_DIR, DEFAULT_CHECKPOINT, load_model
+from gatsol_sink import make_rows, open_sink, written_ids
+
+sys.path.insert(0, os.path.join(ROOT_DIR, "Predict", "tools", "pdb_to_cm"))
+from pdb_to_cm import read_atoms  # noqa: E402
+
+CONTACT_THRESHOLD = 10.0  # Å, as passed by pdb_to_cm.sh
+PARAMETERS_JSON = os.path.join(ROOT_DIR, "Predict", "tools", "feature_extract", "Protein_parameters_setting.json")
+AMINO_ACIDS = "ARNDCQEGHILKMFPSTWYV"
+ESM_LAYER = 33
+
+
+def read_ca_coords(structure, chain=".", model=1):
+    """CA coordinates (N x 3) from a PDB path, PDB text or an existing coordinate array."""
+    if isinstance(structure, (np.ndarray, torch.Tensor)):
+        return np.asarray(structure, dtype=np.float64).reshape(-1, 3)
+    if os.path.isfile(structure):
+        with open(structure, "r") as f:
+            atoms = read_atoms(f, chain, model)
+    elif "\n" not in structure.strip() and not structure.lstrip().startswith(("ATOM", "HETATM")):
+        # a single line without coordinate records is a path, not PDB text
+        raise FileNotFoundError(f"No such PDB file: {structure}")
+    else:
+        atoms = read_atoms(io.StringIO(structure), chain, model)
+    return np.asarray(atoms, dtype=np.float64).reshape(-1, 3)
+
+
+def contact_edges(coords, threshold=CONTACT_THRESHOLD):
+    """0-based (i, j), i < j, residue pairs closer than threshold; same pairs as pdb_to_cm.compute_contacts."""
+    coords = np.asarray(coords, dtype=np.float64)
+    dx, dy, dz = (coords[:, None, k] - coords[None, :, k] for k in range(3))
+    dist = np.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
+    i, j = np.nonzero(np.triu(dist < threshold, k=1))
+    return torch.from_numpy(np.stack([i, j])).long()
+
+
+def write_cm(edges, path):
+    # pdb_to_cm.py format: 1-based "i,j" per line
+    with open(path, "w") as f:
+        for i, j in (edges + 1).t().tolist():
+            f.write(f"{i},{j}\n")
+
+
+def build_graph(node_features, edges):
+    data = Data(x=node_features, edge_index=edges.contiguous(), y=torch.tensor(0).reshape(1,))
+    data.edge_index, _ = add_self_loops(data.edge_index, num_nodes=node_features.shape[0])
+    return prepare_graph(data)
+
+
+class FeatureExtractor:
+    """BLOSUM62 (iFeatureOmega) + ESM-1b layer-33 node features, models loaded once."""
+
+    def __init__(self, device="cpu", esm_batch_size=1):
+        self.device = device
+        self.esm_batch_size = esm_batch_size
+        self._esm = None
+        self._blosum = None
+
+    def _load_esm(self):
+        if self._esm is None:
+            import esm
+            model, alphabet = esm.pretrained.esm1b_t33_650M_UR50S()
+            self._esm = (model.eval().to(self.device), alphabet.get_batch_converter())
+        return self._esm
+
+    def esm(self, records):
+        """Per-residue ESM-1b representations for [(id, sequence), ...]."""
+        model, batch_converter = self._load_esm()
+        out = []
+        for start in range(0, len(records), self.esm_batch_size):
+            chunk = records[start:start + self.esm_batch_size]
+            _, _, tokens = batch_converter(chunk)
+            with torch.no_grad():
+                results = model(tokens.to(self.device), repr_layers=[ESM_LAYER])
+            representations = results["representations"][ESM_LAYER].cpu()
+            for k, (_, seq) in enumerate(chunk):
+                out.append(representations[k, 1:len(seq) + 1].reshape(-1, 1280))
+        return out
+
+    @staticmethod
+    def _ifeature_blosum(sequence):
+        import iFeatureOmegaCLI
+        with tempfile.NamedTemporaryFile("w", suffix=".fasta", delete=False) as f:
+            f.write(f">seq\n{sequence}\n")
+        try:
+            protein = iFeatureOmegaCLI.iProtein(f.name)
+            with contextlib.redirect_stdout(io.StringIO()):
+                protein.import_parameters(PARAMETERS_JSON)
+            protein.get_descriptor("BLOSUM62")
+            return torch.from_numpy(protein.encodings.values.reshape(-1, 20)).float()
+        finally:
+            os.remove(f.name)
+
+    def blosum_table(self):
+        # iFeatureOmega encodes each residue independently, so one call over the 20
+        # amino acids yields the lookup table for every sequence
+        if self._blosum is None:
+            self._blosum = self._ifeature_blosum(AMINO_ACIDS)
+        return self._blosum
+
+    def blosum62(self, sequence):
+        sequence = sequence.upper()
+        if set(sequence) <= set(AMINO_ACIDS):
+            table = self.blosum_table()
+            return table[torch.tensor([AMINO_ACIDS.index(aa) for aa in sequence], dtype=torch.long)]
+        # non-standard residues: let iFeatureOmega apply its own substitutions
+        return self._ifeature_blosum(sequence)
+
+
+class GATSolPipeline:
+    def __init__(self, checkpoint=DEFAULT_CHECKPOINT, device=None, threshold=CONTACT_THRESHOLD,
+                 quantized=None, batch_size=1, esm_batch_size=1, intermediates=None, dense_threshold=None,
+                 coarsen=None, max_nodes=None, max_edges=None, memory_budget=None, cost_model=None):
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() and not quantized else "cpu"
+        self.device = torch.device(device)
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.intermediates = intermediates
+        self.coarsen = coarsen
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        # memory_budget (bytes) replaces the fixed batch_size with cost-model packing
+        self.memory_budget = memory_budget
+        self.cost_model = cost_model
+        if quantized and dense_threshold:
+            # densify_model reloads the fp32 state dict, which an int8 model no longer has
+            raise ValueError("dense_threshold cannot be combined with a quantized checkpoint")
+        self.features = FeatureExtractor(self.device, esm_batch_size)
+        if quantized:
+            from gatsol_quantize import load_quantized
+            self.model = load_quantized(quantized)
+        else:
+            self.model = load_model(checkpoint, self.device)
+        if dense_threshold:
+            from gatsol_dense_gat import densify_model
+            self.model = densify_model(self.model, dense_threshold)
+        self.timings = defaultdict(float)
+        if intermediates:
+            os.makedirs(os.path.join(intermediates, "cm"), exist_ok=True)
+            os.makedirs(os.path.join(intermediates, "pkl"), exist_ok=True)
+
+    @contextlib.contextmanager
+    def _timed(self, stage):
+        start = time.perf_counter()
+        yield
+        self.timings[stage] += time.perf_counter() - start
+
+    def featurize(self, records):
+        """records: [(id, sequence, structure), ...] -> [Data, ...] in the same order."""
+        records = list(records)
+        with self._timed("contacts"):
+            coords = [read_ca_coords(structure) for _, _, structure in records]
+            for (sid, seq, _), c in zip(records, coords):
+                # contacts index node features; a mismatched structure would point past the last residue
+                if len(c) != len(seq):
+                    raise ValueError(f"{sid}: structure has {len(c)} CA atoms but the sequence has {len(seq)} residues")
+            edges = [contact_edges(c, self.threshold) for c in coords]
+        with self._timed("esm"):
+            esm_features = self.features.esm([(sid, seq) for sid, seq, _ in records])
+        with self._timed("blosum"):
+            blosum_features = [self.features.blosum62(seq) for _, seq, _ in records]
+        graphs = [build_graph(torch.cat((b, e), 1), edge) for b, e, edge in zip(blosum_features, esm_features, edges)]
+        if self.intermediates:
+            with self._timed("intermediates"):
+                for (sid, _, _), edge, graph in zip(records, edges, graphs):
+                    write_cm(edge, os.path.join(self.intermediates, "cm", sid + ".cm"))
+                    with open(os.path.join(self.intermediates, "pkl", sid + ".pkl"), "wb") as f:
+                        pickle.dump(graph, f)
+        if self.coarsen:
+            from gatsol_coarsen import coarsen_graph
+            with self._timed("coarsen"):
+                graphs = [coarsen_graph(graph, self.max_nodes, self.max_edges, self.coarsen, pos)
+                          for graph, pos in zip(graphs, coords)]
+        return graphs
+
+    def _batches(self, graphs):
+        if self.memory_budget is None:
+            return DataLoader(graphs, batch_size=self.batch_size, shuffle=False)
+        from gatsol_batching import CostModel, pack
+        cost_model = self.cost_model or CostModel.from_config(training=False)
+        groups = pack([cost_model(data) for data in graphs], self.memory_budget, base=cost_model.base)
+        return (Batch.from_data_list([graphs[i] for i in group]) for group in groups)
+
+    def score(self, graphs):
+        with self._timed("gat"):
+            scores = []
+            with torch.no_grad():
+                for data in self._batches(graphs):
+                    output = self.model(data.to(self.device))
+                    scores.extend(output.reshape(-1).float().cpu().tolist())
+        return scores
+
+    def predict(self, records):
+        return self.score(self.featurize(records))
+
+
+def load_records(list_csv, pdb_dir):
+    df = pd.read_csv(list_csv)
+    return [(sid, seq, os.path.join(pdb_dir, f"{sid}.pdb")) for sid, seq in zip(df["id"], df["sequence"])]
+
+
+def main():
+    need_dir = os.path.join(ROOT_DIR, "Predict", "NEED_to_PREPARE")
+    parser = argparse.ArgumentParser(description="Run the GATSol pipeline in a single process.")
+    parser.add_argument("--list", default=os.path.join(need_dir, "list.csv"), help="CSV with id,sequence columns")
+    parser.add_argument("--pdb_dir", default=os.path.join(need_dir, "pdb"), help="Directory holding <id>.pdb")
+    parser.add_argument("--out", default=os.path.join(ROOT_DIR, "Predict", "Output.csv"), help="Output file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--format", choices=["csv", "jsonl", "parquet"], default=None, help="Output format, inferred from --out by default")
+    parser.add_argument("--standardized", action="store_true", help="Write the benchmarking wrapper's schema instead of id,sequence,Solubility_hat")
+    parser.add_argument("--flush_interval", type=float, default=5.0, help="Seconds between durable flushes of the output")
+    parser.add_argument("--resume", action="store_true", help="Keep rows already in --out and only predict the missing ids")
+    parser.add_argument("--chunk_size", type=int, default=16, help="Proteins featurized and scored per output write")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="GATClassifier state_dict")
+    parser.add_argument("--quantized", default=None, help="Use an int8 checkpoint from gatsol_quantize.py instead")
+    parser.add_argument("--threshold", type=float, default=CONTACT_THRESHOLD, help="Contact distance threshold in angstrom")
+    parser.add_argument("--batch_size", type=int, default=1, help="Graphs per GAT forward pass")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Pack GAT batches by predicted activation memory (MB) instead of --batch_size")
+    parser.add_argument("--cost_model", default=None, help="Cost model JSON from 'gatsol_batching.py calibrate --mode inference'")
+    parser.add_argument("--esm_batch_size", type=int, default=1, help="Sequences per ESM forward pass")
+    parser.add_argument("--dense_threshold", type=int, default=None, help="Dense attention for graphs up to this many residues (gatsol_dense_gat.py)")
+    parser.add_argument("--coarsen", choices=["window", "spatial"], default=None, help="Pool residues of graphs over the node/edge budget into super-nodes (gatsol_coarsen.py)")
+    parser.add_argument("--max_nodes", type=int, default=1000, help="Node budget per graph with --coarsen")
+    parser.add_argument("--max_edges", type=int, default=None, help="Edge budget per graph with --coarsen, self-loops included")
+    parser.add_argument("--keep_intermediates", default=None, help="Also write cm/*.cm and pkl/*.pkl into this directory")
+    args = parser.parse_args()
+    if args.quantized and args.dense_threshold:
+        parser.error("--dense_threshold cannot be combined with --quantized (dense attention needs the fp32 GATConv weights)")
+
+    cost_model = None
+    if args.cost_model:
+        from gatsol_batching import CostModel
+        cost_model = CostModel.load(args.cost_model)
+    start = time.perf_counter()
+    pipeline = GATSolPipeline(args.checkpoint, threshold=args.threshold, quantized=args.quantized,
+                              batch_size=args.batch_size, esm_batch_size=args.esm_batch_size,
+                              intermediates=args.keep_intermediates, dense_threshold=args.dense_threshold,
+                              coarsen=args.coarsen, max_nodes=args.max_nodes, max_edges=args.max_edges,
+                              memory_budget=args.memory_budget * 2 ** 20 if args.memory_budget else None,
+                              cost_model=cost_model)
+    pipeline.timings["load"] = time.perf_counter() - start
+    schema = "standard" if args.standardized else "raw"
+    records = load_records(args.list, args.pdb_dir)
+    if args.resume:
+        done = written_ids(args.out, args.format, schema)
+        records = [r for r in records if r[0] not in done]
+    with open_sink(args.out, args.format, schema, args.flush_interval, append=args.resume) as sink:
+        for i in range(0, len(records), args.chunk_size):
+            chunk = records[i:i + args.chunk_size]
+            scores = pipeline.predict(chunk)
+            sink.write(make_rows([r[0] for r in chunk], [r[1] for r in chunk], scores, schema))
+    timings = ", ".join(f"{stage}: {seconds:.2f}s" for stage, seconds in pipeline.timings.items())
+    print(f"{len(records)} proteins scored in {time.perf_counter() - start:.2f}s ({timings}), written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
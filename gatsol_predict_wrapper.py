@@ -2,8 +2,11 @@
 """
 GATSol standardized batch wrapper for benchmarking
 - Accepts: --fasta <input.fasta> --out <output.csv>
-- Requires: matching PDB files for each sequence in the FASTA
-- Runs the full GATSol pipeline and outputs a unified benchmarking CSV
+- Structures: <id>.pdb in --pdb_dir, else the --structures providers (archive, predictor command, stub)
+- Runs the full GATSol pipeline in-process (gatsol_api.predict) and outputs a unified benchmarking CSV
+- --subprocess: run Predict.sh in a private workspace instead
+- --shards N: split the FASTA by residue count and score shards in parallel worker processes
+- Optional --cache: previously scored (sequence, structure, model) pairs skip the pipeline
 """
 import os
 import sys
@@ -11,10 +14,17 @@ import argparse
 import tempfile
 import shutil
 import subprocess
+import csv
 import pandas as pd
 from Bio import SeqIO
 
-WRAPPER_PREDICTOR_NAME = "GATSol"
+from gatsol_api import predict
+from gatsol_cache import ResultCache, make_key, structure_hash
+from gatsol_structures import DirectoryProvider, StructureCache, StructureResolver, make_provider
+from gatsol_shard import merge_shards, run_shards, split_shards
+from gatsol_sink import make_rows, open_sink
+
+CONTACT_THRESHOLD = 10.0  # pdb_to_cm.sh -t
 
 
 def parse_fasta(fasta_path):
@@ -36,72 +46,154 @@ def write_fasta_dir(seqs, outdir):
             f.write(f">{sid}\n{seq}\n")
 
 
-def check_pdbs(seqs, pdb_dir):
-    missing = []
+def prepare_workspace(seqs, structures, workspace):
+    """Job-private inputs: workspace/input/{list.csv,fasta,pdb} with the PDBs linked in."""
+    input_dir = os.path.join(workspace, "input")
+    job_pdb_dir = os.path.join(input_dir, "pdb")
+    # a kept --work_dir may hold the inputs of an earlier run: start from an empty input/
+    shutil.rmtree(input_dir, ignore_errors=True)
+    os.makedirs(job_pdb_dir, exist_ok=True)
+    write_fasta_dir(seqs, os.path.join(input_dir, "fasta"))
+    write_list_csv(seqs, os.path.join(input_dir, "list.csv"))
     for sid, _ in seqs:
-        pdb_path = os.path.join(pdb_dir, f"{sid}.pdb")
-        if not os.path.isfile(pdb_path):
-            missing.append(sid)
-    return missing
-
-
-def run_pipeline(predict_dir):
-    # Predict.sh expects to be run from within the tools dir
-    subprocess.run(["bash", "Predict.sh"], cwd=os.path.join(predict_dir, "tools"), check=True)
-
-
-def standardize_output(csv_path, fasta_seqs, out_path):
-    df = pd.read_csv(csv_path)
-    # df must have id, sequence, Solubility_hat
-    out_rows = []
-    for _, row in df.iterrows():
-        acc = row["id"]
-        seq = row["sequence"]
-        score = row["Solubility_hat"]
-        # GATSol outputs a single score, so set probabilities as NA
-        out_rows.append({
-            "Accession": acc,
-            "Sequence": seq,
-            "Predictor": WRAPPER_PREDICTOR_NAME,
-            "SolubilityScore": score,
-            "Probability_Soluble": "NA",
-            "Probability_Insoluble": "NA"
-        })
-    pd.DataFrame(out_rows).to_csv(out_path, index=False)
+        os.symlink(os.path.abspath(structures[sid]), os.path.join(job_pdb_dir, f"{sid}.pdb"))
+    return input_dir
+
+
+def run_pipeline(predict_dir, workspace, out_path, checkpoint):
+    # every stage reads and writes inside the job's workspace, so jobs can run concurrently
+    # Predict.py streams rows in the standardized schema straight into out_path
+    subprocess.run(["bash", os.path.join(predict_dir, "tools", "Predict.sh"),
+                    "--input_dir", os.path.join(workspace, "input"), "--work_dir", os.path.join(workspace, "work"),
+                    "--out", out_path, "--standardized", "--checkpoint", checkpoint],
+                   cwd=workspace, check=True)
+
+
+def cache_keys(seqs, structures, cache, checkpoint):
+    model_digest = cache.model_digest(checkpoint)
+    return {sid: make_key(seq, structure_hash(structures[sid]), CONTACT_THRESHOLD, model_digest)
+            for sid, seq in seqs}
+
+
+def predict_in_process(seqs, structures, checkpoint, out_path=None, chunk_size=16):
+    """Scores {id: score}; with out_path, rows are also streamed there in FASTA order."""
+    scores = {}
+    sink = open_sink(out_path) if out_path else None
+    try:
+        for start in range(0, len(seqs), chunk_size):
+            chunk = seqs[start:start + chunk_size]
+            chunk_scores = predict([(sid, seq, structures[sid]) for sid, seq in chunk], checkpoint)
+            scores.update((sid, score) for (sid, _), score in zip(chunk, chunk_scores))
+            if sink is not None:
+                sink.write(make_rows([sid for sid, _ in chunk], [seq for _, seq in chunk], chunk_scores))
+    finally:
+        if sink is not None:
+            sink.close()
+    return scores
+
+
+def read_computed(computed_path):
+    with open(computed_path, newline="") as f:
+        return {row["Accession"]: float(row["SolubilityScore"]) for row in csv.DictReader(f)}
+
+
+def merge_output(fasta_seqs, computed, cached, out_path):
+    # cache hits and freshly computed rows, in FASTA order
+    scores = dict(cached)
+    scores.update(computed)
+    with open_sink(out_path) as sink:
+        sink.write(make_rows([sid for sid, _ in fasta_seqs], [seq for _, seq in fasta_seqs],
+                             [scores[sid] for sid, _ in fasta_seqs]))
+    return scores
 
 
 def main():
     parser = argparse.ArgumentParser(description="GATSol batch wrapper for benchmarking.")
     parser.add_argument("--fasta", required=True, help="Input FASTA file")
-    parser.add_argument("--out", required=True, help="Output CSV file")
+    parser.add_argument("--out", required=True, help="Output file (.csv, .jsonl or .parquet)")
     parser.add_argument("--predict_dir", default="Predict", help="Path to GATSol Predict dir")
+    parser.add_argument("--pdb_dir", default=None, help="Directory holding <id>.pdb (default: <predict_dir>/NEED_to_PREPARE/pdb)")
+    parser.add_argument("--checkpoint", default=None, help="GATClassifier state_dict (default: check_point/best_model/best_model.pt)")
+    parser.add_argument("--subprocess", action="store_true", help="Run Predict.sh in a job workspace instead of the in-process API")
+    parser.add_argument("--work_dir", default=None, help="With --subprocess: keep the job workspace here instead of a temporary directory")
+    parser.add_argument("--structures", action="append", default=[],
+                        help="Structure provider for sequences without <id>.pdb in --pdb_dir, tried in order: "
+                             "dir:PATH, archive:PATH, command:TEMPLATE or stub (repeatable)")
+    parser.add_argument("--structure_cache", default=None, help="Keep predicted structures in this directory across runs")
+    parser.add_argument("--structure_batch_size", type=int, default=8, help="Sequences per structure predictor call")
+    parser.add_argument("--structure_concurrency", type=int, default=1, help="Structure predictor calls running at the same time")
+    parser.add_argument("--shards", type=int, default=1, help="Split the input into this many shards balanced by residue count")
+    parser.add_argument("--workers", type=int, default=2, help="With --shards: worker processes scoring shards in parallel")
+    parser.add_argument("--esm_threads", type=int, default=None, help="With --shards: torch threads per worker while running ESM")
+    parser.add_argument("--gat_threads", type=int, default=None, help="With --shards: torch threads per worker while running the GAT")
+    parser.add_argument("--shard_dir", default=None, help="With --shards: keep shard outputs here so a rerun only scores failed shards")
+    parser.add_argument("--max_retries", type=int, default=2, help="With --shards: retries of failed shards")
+    parser.add_argument("--cache", default=None, help="SQLite result cache; only cache misses are run through the pipeline")
+    parser.add_argument("--cache_size", type=int, default=1_000_000, help="Maximum cached results (least recently used are evicted)")
     args = parser.parse_args()
 
     fasta_path = os.path.abspath(args.fasta)
     out_csv = os.path.abspath(args.out)
     predict_dir = os.path.abspath(args.predict_dir)
+    pdb_dir = os.path.abspath(args.pdb_dir or os.path.join(predict_dir, "NEED_to_PREPARE", "pdb"))
+    checkpoint = os.path.abspath(args.checkpoint or os.path.join(predict_dir, "..", "check_point", "best_model", "best_model.pt"))
 
     with tempfile.TemporaryDirectory() as tmpdir:
-        # Prepare input dirs
-        need_dir = os.path.join(predict_dir, "NEED_to_PREPARE")
-        fasta_dir = os.path.join(need_dir, "fasta")
-        pdb_dir = os.path.join(need_dir, "pdb")
-        os.makedirs(fasta_dir, exist_ok=True)
-        os.makedirs(pdb_dir, exist_ok=True)
+        workspace = os.path.abspath(args.work_dir) if args.work_dir else tmpdir
+        os.makedirs(workspace, exist_ok=True)
         # Parse FASTA
         seqs = parse_fasta(fasta_path)
-        # Check PDBs
-        missing = check_pdbs(seqs, pdb_dir)
+        # Find a structure for every sequence: --pdb_dir first, then the --structures providers
+        resolver = StructureResolver([DirectoryProvider(pdb_dir)] + [make_provider(spec) for spec in args.structures],
+                                     StructureCache(args.structure_cache or os.path.join(workspace, "structures")),
+                                     args.structure_batch_size, args.structure_concurrency)
+        structures = resolver.resolve(seqs)
+        missing = [sid for sid, _ in seqs if sid not in structures]
         if missing:
             print(f"Error: Missing PDBs for: {', '.join(missing)}", file=sys.stderr)
             sys.exit(1)
-        # Write fasta files and list.csv
-        write_fasta_dir(seqs, fasta_dir)
-        write_list_csv(seqs, os.path.join(need_dir, "list.csv"))
-        # Run pipeline
-        run_pipeline(predict_dir)
-        # Standardize output
-        standardize_output(os.path.join(predict_dir, "Output.csv"), seqs, out_csv)
+        if args.structures:
+            print("Structures: " + ", ".join(f"{name}: {count}" for name, count in resolver.counts.items()))
+        # Look up previously scored proteins
+        cached, keys, cache = {}, {}, None
+        if args.cache:
+            cache = ResultCache(args.cache, args.cache_size)
+            keys = cache_keys(seqs, structures, cache, checkpoint)
+            hits = cache.get_many(keys.values())
+            cached = {sid: hits[keys[sid]] for sid, _ in seqs if keys[sid] in hits}
+            print(f"Cache: {len(cached)}/{len(seqs)} hits")
+        todo = [(sid, seq) for sid, seq in seqs if sid not in cached]
+        if args.shards > 1 and todo:
+            # Score shards in worker processes and merge them in FASTA order
+            records = [(sid, seq, structures[sid]) for sid, seq in todo]
+            shards = split_shards(todo, args.shards)
+            shard_dir = os.path.abspath(args.shard_dir) if args.shard_dir else os.path.join(workspace, "shards")
+            failed = run_shards(records, shards, checkpoint, shard_dir, args.workers, args.esm_threads,
+                                args.gat_threads, args.max_retries)
+            if failed:
+                print(f"Error: shards {failed} failed; rerun with --shard_dir {shard_dir} to retry only those",
+                      file=sys.stderr)
+                sys.exit(1)
+            computed = merge_shards(shard_dir, len(shards))
+            if cache is None:
+                merge_output(seqs, computed, {}, out_csv)
+        elif not args.subprocess:
+            # Score in this process, streaming straight to the output when nothing is cached
+            computed = predict_in_process(todo, structures, checkpoint, out_csv if cache is None else None)
+        elif todo:
+            # Write fasta files, list.csv and PDB links into the job workspace
+            prepare_workspace(todo, structures, workspace)
+            if cache is None:
+                run_pipeline(predict_dir, workspace, out_csv, checkpoint)
+            else:
+                run_pipeline(predict_dir, workspace, os.path.join(workspace, "computed.csv"), checkpoint)
+                computed = read_computed(os.path.join(workspace, "computed.csv"))
+        else:
+            computed = {}
+        if cache is not None:
+            scores = merge_output(seqs, computed, cached, out_csv)
+            cache.put_many((keys[sid], scores[sid]) for sid, _ in todo)
+            cache.close()
         print(f"Done. Results written to {out_csv}")
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Int8 dynamic quantization of GATClassifier for CPU serving
+- Converts best_model.pt into an int8 checkpoint (GATConv projections, lin1, lin2)
+- Reports accuracy against the fp32 model on a held-out split, CPU latency and memory
+
+Usage:
+    python gatsol_quantize.py --checkpoint check_point/best_model/best_model.pt \
+        --out check_point/best_model/best_model_int8.pt --split test
+"""
+import os
+import argparse
+import torch
+import torch.nn as nn
+from torch_geometric.loader import DataLoader
+from torch_geometric.nn import GATConv
+
+import gatsol_eval
+from gatsol_model import DEFAULT_CHECKPOINT, build_model, load_model, projection_name
+
+DEFAULT_INT8_CHECKPOINT = os.path.join(os.path.dirname(DEFAULT_CHECKPOINT), "best_model_int8.pt")
+
+
+def _dense_projection(conv):
+    # PyG's Linear is not picked up by quantize_dynamic, swap it for an nn.Linear
+    # holding the same weights. The source/target projection is shared, so the
+    # alias (lin_dst on torch_geometric < 2.5) is dropped to quantize it only once;
+    # GATConv only reads it for bipartite (tuple) inputs, which GATSol never uses.
+    name = projection_name(conv)
+    lin = getattr(conv, name)
+    dense = nn.Linear(lin.in_channels, lin.out_channels, bias=lin.bias is not None)
+    with torch.no_grad():
+        dense.weight.copy_(lin.weight)
+        if lin.bias is not None:
+            dense.bias.copy_(lin.bias)
+    setattr(conv, name, dense)
+    if name == "lin_src":
+        conv.lin_dst = None
+
+
+def quantize_model(model, dtype=torch.qint8):
+    """Return an int8 dynamically quantized copy of an fp32 GATClassifier (CPU only)."""
+    model = model.cpu().eval()
+    for module in model.modules():
+        if isinstance(module, GATConv):
+            _dense_projection(module)
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=dtype)
+
+
+def save_quantized(model, path):
+    torch.save(model.state_dict(), path)
+
+
+def load_quantized(path=DEFAULT_INT8_CHECKPOINT):
+    # rebuild the quantized module structure, then load the packed int8 weights
+    model = quantize_model(build_model("cpu"))
+    model.load_state_dict(torch.load(path, map_location="cpu"))
+    model.eval()
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a GATSol checkpoint to int8 and report its accuracy/speed/memory.")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="fp32 state_dict (best_model.pt)")
+    parser.add_argument("--out", default=DEFAULT_INT8_CHECKPOINT, help="Where to write the int8 state_dict")
+    parser.add_argument("--dataset", default=gatsol_eval.DEFAULT_DATASET, help="GATSol_datasets.pkl used for the report")
+    parser.add_argument("--split", default="test", help="Held-out split to evaluate on (test, val or val1)")
+    parser.add_argument("--limit", type=int, default=None, help="Only evaluate the first N graphs")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads")
+    parser.add_argument("--no_eval", action="store_true", help="Only convert, skip the report")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    fp32 = load_model(args.checkpoint, "cpu")
+    int8 = quantize_model(load_model(args.checkpoint, "cpu"))
+    save_quantized(int8, args.out)
+    print(f"int8 model written to {args.out}")
+    if args.no_eval:
+        return
+
+    loader = DataLoader(gatsol_eval.load_split(args.dataset, args.split, args.limit), batch_size=1, shuffle=False)
+    results = {}
+    for name, model in (("fp32", fp32), ("int8", int8)):
+        with gatsol_eval.PeakMemory("cpu") as mem:
+            y_hat, y_true = gatsol_eval.predict(model, loader)
+        results[name] = y_hat
+        print(f"[{name}] {gatsol_eval.format_metrics(gatsol_eval.metrics(y_true, y_hat))}")
+        print(f"[{name}] weights: {gatsol_eval.state_dict_bytes(model) / 2 ** 20:.1f} MB, "
+              f"peak RSS growth: {mem.peak_mb:.1f} MB, "
+              f"latency: {gatsol_eval.time_forward(model, loader):.2f} ms/graph")
+    print(f"[int8 vs fp32] {gatsol_eval.format_metrics(gatsol_eval.agreement(results['fp32'], results['int8']))}")
+
+
+if __name__ == "__main__":
+    main()
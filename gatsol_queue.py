@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+File-based work queue for multi-node GATSol scoring
+- init: resolve structures for a FASTA file and cut it into manifest chunks in a queue directory
+- worker: any number of processes, on any node that shares the queue directory, claim chunks
+  through lease files created with O_EXCL, heartbeat them while scoring, and reclaim
+  leases whose heartbeat is older than --lease_seconds (dead workers)
+- Each chunk result is written atomically to results/; finalize merges them in input order
+- --scorer stub scores from a sequence hash without loading any model, for testing the queue
+
+Usage:
+    python gatsol_queue.py init --queue_dir /shared/q --fasta proteome.fasta --pdb_dir structures --chunk_size 200
+    python gatsol_queue.py worker --queue_dir /shared/q          # on every node, as many as fit
+    python gatsol_queue.py status --queue_dir /shared/q
+    python gatsol_queue.py finalize --queue_dir /shared/q --out proteome.csv
+"""
+import os
+import csv
+import json
+import time
+import uuid
+import glob
+import socket
+import hashlib
+import argparse
+import threading
+import traceback
+
+from Bio import SeqIO
+
+from gatsol_model import DEFAULT_CHECKPOINT
+from gatsol_sink import make_rows, open_sink
+from gatsol_structures import DirectoryProvider, StructureCache, StructureResolver, make_provider
+
+
+def chunk_ids(queue_dir):
+    with open(os.path.join(queue_dir, "queue.json")) as f:
+        return list(range(json.load(f)["num_chunks"]))
+
+
+def _path(queue_dir, kind, k, suffix=".csv"):
+    return os.path.join(queue_dir, kind, f"chunk_{k:05d}{suffix}")
+
+
+def read_chunk(queue_dir, k):
+    with open(_path(queue_dir, "chunks", k), newline="") as f:
+        return [(row["id"], row["sequence"], row["structure"]) for row in csv.DictReader(f)]
+
+
+def init_queue(queue_dir, seqs, structures, chunk_size):
+    for kind in ("chunks", "leases", "results", "errors"):
+        os.makedirs(os.path.join(queue_dir, kind), exist_ok=True)
+    num_chunks = 0
+    for num_chunks, start in enumerate(range(0, len(seqs), chunk_size), start=1):
+        with open(_path(queue_dir, "chunks", num_chunks - 1), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id", "sequence", "structure"])
+            writer.writerows((sid, seq, structures[sid]) for sid, seq in seqs[start:start + chunk_size])
+    # written last: workers only start once the manifest is complete
+    with open(os.path.join(queue_dir, "queue.json"), "w") as f:
+        json.dump({"num_chunks": num_chunks, "num_sequences": len(seqs)}, f)
+    return num_chunks
+
+
+class Lease:
+    """Exclusive claim on one chunk: leases/chunk_k.lease holds the owner, its mtime is the heartbeat."""
+
+    def __init__(self, queue_dir, k, worker_id, lease_seconds):
+        self.path = _path(queue_dir, "leases", k, ".lease")
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self):
+        if self._create():
+            return True
+        try:
+            age = time.time() - os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return self._create()
+        if age < self.lease_seconds:
+            return False
+        # expired: rename is atomic, so only one of the competing workers takes the stale lease away
+        stale = f"{self.path}.expired.{self.worker_id}"
+        try:
+            os.rename(self.path, stale)
+        except FileNotFoundError:
+            return False
+        if time.time() - os.path.getmtime(stale) < self.lease_seconds:
+            # another worker took the lease over in between and we moved its fresh lease: put it back
+            # (link fails if yet another lease exists; the results are the same whoever finishes)
+            try:
+                os.link(stale, self.path)
+            except FileExistsError:
+                pass
+            os.remove(stale)
+            return False
+        os.remove(stale)
+        return self._create()
+
+    def _create(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(self.worker_id)
+        return True
+
+    def owned(self):
+        try:
+            with open(self.path) as f:
+                return f.read() == self.worker_id
+        except FileNotFoundError:
+            return False
+
+    def _beat(self, interval):
+        while not self._stop.wait(interval):
+            if self.owned():
+                os.utime(self.path)
+
+    def start_heartbeat(self, interval):
+        self._thread = threading.Thread(target=self._beat, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def release(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.owned():
+            os.remove(self.path)
+
+
+def stub_scores(records):
+    return [int(hashlib.sha256(seq.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF for _, seq, _ in records]
+
+
+def make_scorer(name, checkpoint):
+    if name == "stub":
+        return stub_scores
+    from gatsol_api import get_pipeline
+    pipeline = get_pipeline(checkpoint)
+    return pipeline.predict
+
+
+def failed_attempts(queue_dir, k):
+    return len(glob.glob(_path(queue_dir, "errors", k, ".*.err")))
+
+
+def run_worker(queue_dir, score, worker_id, lease_seconds=600, heartbeat=30, poll=10, max_attempts=3):
+    """Score chunks until every chunk has a result or has failed max_attempts times."""
+    ids = chunk_ids(queue_dir)
+    done = 0
+    while True:
+        pending = [k for k in ids if not os.path.exists(_path(queue_dir, "results", k))
+                   and failed_attempts(queue_dir, k) < max_attempts]
+        if not pending:
+            return done
+        claimed = False
+        for k in pending:
+            lease = Lease(queue_dir, k, worker_id, lease_seconds)
+            # re-check after claiming: the chunk may have finished since pending was listed
+            if not lease.acquire():
+                continue
+            if os.path.exists(_path(queue_dir, "results", k)):
+                lease.release()
+                continue
+            claimed = True
+            lease.start_heartbeat(heartbeat)
+            try:
+                records = read_chunk(queue_dir, k)
+                start = time.perf_counter()
+                scores = score(records)
+                tmp_path = _path(queue_dir, "results", k, f".csv.{worker_id}.tmp")
+                with open_sink(tmp_path, "csv", flush_interval=float("inf")) as sink:
+                    sink.write(make_rows([r[0] for r in records], [r[1] for r in records], scores))
+                os.replace(tmp_path, _path(queue_dir, "results", k))
+                done += 1
+                print(f"[{worker_id}] chunk {k}: {len(records)} proteins in {time.perf_counter() - start:.2f}s", flush=True)
+            except Exception:
+                with open(_path(queue_dir, "errors", k, f".{worker_id}.err"), "w") as f:
+                    f.write(traceback.format_exc())
+                print(f"[{worker_id}] chunk {k} failed, see errors/", flush=True)
+            finally:
+                lease.release()
+        if not claimed:
+            # everything left is leased by live workers; wait for them to finish or expire
+            time.sleep(poll)
+
+
+def queue_status(queue_dir, lease_seconds=600, max_attempts=3):
+    counts = {"done": 0, "running": 0, "expired": 0, "failed": 0, "pending": 0}
+    for k in chunk_ids(queue_dir):
+        lease_path = _path(queue_dir, "leases", k, ".lease")
+        if os.path.exists(_path(queue_dir, "results", k)):
+            counts["done"] += 1
+        elif failed_attempts(queue_dir, k) >= max_attempts:
+            counts["failed"] += 1
+        elif os.path.exists(lease_path):
+            expired = time.time() - os.path.getmtime(lease_path) >= lease_seconds
+            counts["expired" if expired else "running"] += 1
+        else:
+            counts["pending"] += 1
+    return counts
+
+
+def finalize(queue_dir, out_path):
+    """Merge all chunk results into out_path in manifest order; returns the chunks without a result."""
+    missing = [k for k in chunk_ids(queue_dir) if not os.path.exists(_path(queue_dir, "results", k))]
+    if missing:
+        return missing
+    with open_sink(out_path) as sink:
+        for k in chunk_ids(queue_dir):
+            with open(_path(queue_dir, "results", k), newline="") as f:
+                rows = list(csv.DictReader(f))
+            sink.write(make_rows([r["Accession"] for r in rows], [r["Sequence"] for r in rows],
+                                 [float(r["SolubilityScore"]) for r in rows]))
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a large FASTA file with any number of workers sharing a queue directory.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    init = sub.add_parser("init", help="Cut a FASTA file into manifest chunks")
+    init.add_argument("--fasta", required=True, help="Input FASTA file")
+    init.add_argument("--pdb_dir", required=True, help="Directory holding <id>.pdb")
+    init.add_argument("--structures", action="append", default=[],
+                      help="Structure provider for sequences without <id>.pdb (see gatsol_structures.py)")
+    init.add_argument("--structure_cache", default=None, help="Where predicted structures are kept (default: <queue_dir>/structures)")
+    init.add_argument("--chunk_size", type=int, default=100, help="Sequences per chunk")
+    worker = sub.add_parser("worker", help="Claim and score chunks until the queue is drained")
+    worker.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="GATClassifier state_dict")
+    worker.add_argument("--scorer", choices=["gatsol", "stub"], default="gatsol", help="stub: hash-based scores, no models loaded")
+    worker.add_argument("--heartbeat", type=float, default=30, help="Seconds between lease heartbeats")
+    worker.add_argument("--poll", type=float, default=10, help="Seconds to wait when every remaining chunk is leased")
+    status = sub.add_parser("status", help="Count done, running, expired, failed and pending chunks")
+    finish = sub.add_parser("finalize", help="Merge chunk results in input order")
+    finish.add_argument("--out", required=True, help="Output file (.csv, .jsonl or .parquet)")
+    for p in (init, worker, status, finish):
+        p.add_argument("--queue_dir", required=True, help="Queue directory on a filesystem shared by all workers")
+    for p in (worker, status):
+        p.add_argument("--lease_seconds", type=float, default=600, help="A lease without heartbeat for this long is reclaimed")
+        p.add_argument("--max_attempts", type=int, default=3, help="Failed attempts after which a chunk is given up")
+    args = parser.parse_args()
+
+    if args.command == "init":
+        seqs = [(r.id, str(r.seq)) for r in SeqIO.parse(args.fasta, "fasta")]
+        resolver = StructureResolver([DirectoryProvider(args.pdb_dir)] + [make_provider(s) for s in args.structures],
+                                     StructureCache(args.structure_cache or os.path.join(args.queue_dir, "structures")))
+        structures = resolver.resolve(seqs)
+        missing = [sid for sid, _ in seqs if sid not in structures]
+        if missing:
+            parser.error(f"Missing PDBs for: {', '.join(missing)}")
+        num_chunks = init_queue(args.queue_dir, seqs, structures, args.chunk_size)
+        print(f"{len(seqs)} sequences in {num_chunks} chunks under {args.queue_dir}")
+    elif args.command == "worker":
+        worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        score = make_scorer(args.scorer, args.checkpoint)
+        done = run_worker(args.queue_dir, score, worker_id, args.lease_seconds, args.heartbeat, args.poll, args.max_attempts)
+        print(f"[{worker_id}] queue drained, {done} chunks scored by this worker")
+    elif args.command == "status":
+        print(", ".join(f"{name}: {n}" for name, n in queue_status(args.queue_dir, args.lease_seconds, args.max_attempts).items()))
+    else:
+        missing = finalize(args.queue_dir, args.out)
+        if missing:
+            parser.exit(1, f"Chunks without a result: {missing}\n")
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Crash-safe training state for re_train.py
+- save_training_state: model, optimizer, progress (epoch, best loss, early-stopping counter,
+  per-epoch history) and every RNG state (python, numpy, torch, CUDA and the training
+  loader's shuffling) in one file, written to a temporary file and renamed into place
+- load_training_state: restores all of it, so a resumed run continues bit-for-bit where the
+  last completed epoch left off
+
+Usage:
+    python re_train.py --epochs 100 --patience 10 --state check_point/train_state.pt
+    python re_train.py --epochs 100 --patience 10 --state check_point/train_state.pt --resume
+"""
+import os
+import random
+import numpy as np
+import torch
+
+
+def atomic_save(obj, path, save=torch.save):
+    """save(obj, tmp) and rename over path, so path is either the old or the complete new file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    save(obj, tmp_path)
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # the rename lives in the directory entry: flush it too, or a crash can still undo it
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def rng_state():
+    return {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def set_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if state["cuda"] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def _order_rng(loader):
+    # random.Random of a MemoryBudgetBatchSampler or BucketBatchSampler, torch.Generator of a RandomSampler;
+    # a DistributedSampler has none (its order is a function of seed and epoch)
+    loader = getattr(loader, "loader", loader)
+    for sampler in (loader.batch_sampler, getattr(loader.batch_sampler, "sampler", None), loader.sampler):
+        for name in ("rng", "generator"):
+            if getattr(sampler, name, None) is not None:
+                return getattr(sampler, name)
+    return None
+
+
+def save_training_state(path, model, optimizer, loader, **progress):
+    rng = _order_rng(loader)
+    state = {
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "rng": rng_state(),
+        "loader_rng": None if rng is None else (rng.getstate() if isinstance(rng, random.Random) else rng.get_state()),
+        "progress": progress,
+    }
+    atomic_save(state, path)
+
+
+def load_training_state(path, model, optimizer, loader, device="cpu"):
+    """Restore model, optimizer and RNG states from path; returns the saved progress dict."""
+    state = torch.load(path, map_location=device, weights_only=False)
+    model.load_state_dict(state["model"])
+    optimizer.load_state_dict(state["optimizer"])
+    set_rng_state(state["rng"])
+    rng = _order_rng(loader)
+    if rng is not None and state["loader_rng"] is not None:
+        if isinstance(rng, random.Random):
+            rng.setstate(state["loader_rng"])
+        else:
+            rng.set_state(state["loader_rng"])
+    return state["progress"]
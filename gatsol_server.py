@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Persistent GATSol prediction service on localhost
+- Keeps ESM-1b and the GAT model warm between requests
+- Coalesces concurrent requests into micro-batches (max size / max wait window)
+- Records are parsed and checked when they arrive, so a bad record is rejected with 400;
+  a micro-batch that still fails is re-run record by record, so only the failing request errors
+
+Endpoints:
+    POST /predict  {"records": [{"id": ..., "sequence": ..., "pdb": "<PDB text>" | "pdb_path": ...}]}
+                   -> {"results": [{"id": ..., "score": ...}]}
+    GET  /health   -> {"status": "ok", "requests": ..., "batches": ...}
+
+Usage:
+    python gatsol_server.py --port 8765 --max_batch_size 8 --max_wait_ms 20
+    python gatsol_loadgen.py --url http://127.0.0.1:8765 --concurrency 8 --requests 200
+"""
+import os
+import json
+import queue
+import argparse
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from gatsol_model import DEFAULT_CHECKPOINT
+from gatsol_pipeline import CONTACT_THRESHOLD, GATSolPipeline, read_ca_coords
+
+
+class MicroBatcher:
+    """Run `fn(items) -> results` on micro-batches gathered from concurrent submit() calls.
+
+    A batch is closed when it holds max_batch_size items or max_wait_ms after its
+    first item arrived, whichever comes first. If fn fails on a batch, every item is
+    retried on its own, so the exception only reaches the submitters whose item fails.
+    """
+
+    def __init__(self, fn, max_batch_size=8, max_wait_ms=20.0):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.num_items = 0
+        self.num_batches = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_one(self, item, future):
+        try:
+            future.set_result(self.fn([item])[0])
+        except Exception as e:
+            future.set_exception(e)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.fn(items)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                else:
+                    for item, future in batch:
+                        self._run_one(item, future)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            self.num_items += len(batch)
+            self.num_batches += 1
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    batcher = None
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._reply(404, {"error": "not found"})
+            return
+        self._reply(200, {"status": "ok", "requests": self.batcher.num_items, "batches": self.batcher.num_batches})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._reply(404, {"error": "not found"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            records = [(r["id"], r["sequence"], r["pdb"] if "pdb" in r else r["pdb_path"]) for r in payload["records"]]
+            missing = [r["pdb_path"] for r in payload["records"] if "pdb" not in r and not os.path.isfile(r["pdb_path"])]
+            if missing:
+                raise ValueError(f"no such PDB file: {', '.join(missing)}")
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {"error": f"bad request: {e}"})
+            return
+        # parse every structure here, so a broken record fails its own request and not the micro-batch
+        parsed = []
+        for sid, seq, structure in records:
+            try:
+                coords = read_ca_coords(structure)
+            except Exception as e:
+                self._reply(400, {"error": f"bad request: {sid}: unreadable PDB ({e})"})
+                return
+            if len(coords) != len(seq):
+                self._reply(400, {"error": f"bad request: {sid}: structure has {len(coords)} CA atoms "
+                                           f"but the sequence has {len(seq)} residues"})
+                return
+            parsed.append((sid, seq, coords))
+        records = parsed
+        futures = [self.batcher.submit(record) for record in records]
+        try:
+            results = [{"id": record[0], "score": future.result()} for record, future in zip(records, futures)]
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+            return
+        self._reply(200, {"results": results})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve GATSol predictions over HTTP with warm models and micro-batching.")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (localhost by default)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--max_batch_size", type=int, default=8, help="Records per micro-batch")
+    parser.add_argument("--max_wait_ms", type=float, default=20.0, help="How long a micro-batch waits to fill up")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="GATClassifier state_dict")
+    parser.add_argument("--quantized", default=None, help="Use an int8 checkpoint from gatsol_quantize.py instead")
+    parser.add_argument("--threshold", type=float, default=CONTACT_THRESHOLD, help="Contact distance threshold in angstrom")
+    parser.add_argument("--batch_size", type=int, default=1, help="Graphs per GAT forward pass inside a micro-batch")
+    parser.add_argument("--esm_batch_size", type=int, default=1, help="Sequences per ESM forward pass inside a micro-batch")
+    args = parser.parse_args()
+
+    pipeline = GATSolPipeline(args.checkpoint, threshold=args.threshold, quantized=args.quantized,
+                              batch_size=args.batch_size, esm_batch_size=args.esm_batch_size)
+    # load ESM-1b and the BLOSUM62 table now rather than on the first request
+    pipeline.features._load_esm()
+    pipeline.features.blosum_table()
+
+    PredictionHandler.batcher = MicroBatcher(pipeline.predict, args.max_batch_size, args.max_wait_ms)
+    server = ThreadingHTTPServer((args.host, args.port), PredictionHandler)
+    print(f"GATSol server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Sharded fan-out scoring for large FASTA inputs
+- split_shards: N shards balanced by residue count (longest-first greedy packing)
+- run_shards: shards scored by a pool of worker processes, each loading the models once
+  and running ESM and the GAT with their own torch thread counts
+- Finished shards are written atomically to shard_dir; failed shards are retried and a
+  rerun with the same shard_dir only scores the shards that are still missing
+- merge_shards: scores back in input order
+"""
+import os
+import csv
+import glob
+import json
+import heapq
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from gatsol_sink import make_rows, open_sink
+
+
+def split_shards(seqs, num_shards):
+    """Input indices per shard, balanced by total residues; each shard keeps input order."""
+    heap = [(0, k) for k in range(min(num_shards, len(seqs)))]
+    shards = [[] for _ in heap]
+    for i in sorted(range(len(seqs)), key=lambda i: (-len(seqs[i][1]), i)):
+        residues, k = heapq.heappop(heap)
+        shards[k].append(i)
+        heapq.heappush(heap, (residues + len(seqs[i][1]), k))
+    return [sorted(shard) for shard in shards]
+
+
+def shard_path(shard_dir, k):
+    return os.path.join(shard_dir, f"shard_{k:05d}.csv")
+
+
+def score_shard(k, records, checkpoint, shard_dir, esm_threads=None, gat_threads=None, chunk_size=16):
+    """Worker: score one shard into shard_dir/shard_k.csv (renamed into place when complete)."""
+    import torch
+    from gatsol_api import get_pipeline
+
+    pipeline = get_pipeline(checkpoint)
+    tmp_path = shard_path(shard_dir, k) + ".tmp"
+    with open_sink(tmp_path, "csv", flush_interval=float("inf")) as sink:
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            if esm_threads:
+                torch.set_num_threads(esm_threads)
+            graphs = pipeline.featurize(chunk)
+            if gat_threads:
+                torch.set_num_threads(gat_threads)
+            scores = pipeline.score(graphs)
+            sink.write(make_rows([r[0] for r in chunk], [r[1] for r in chunk], scores))
+    os.replace(tmp_path, shard_path(shard_dir, k))
+    return k
+
+
+def _stamp(path):
+    return (path, os.stat(path).st_mtime_ns, os.path.getsize(path)) if isinstance(path, str) and os.path.exists(path) else path
+
+
+def _check_manifest(records, shards, checkpoint, shard_dir):
+    # a shard output is only reused for the same proteins, structures and checkpoint
+    model = _stamp(os.path.abspath(checkpoint))
+    digests = [hashlib.sha256(repr(([(*records[i][:2], _stamp(records[i][2])) for i in shard], model)).encode()).hexdigest()
+               for shard in shards]
+    manifest = os.path.join(shard_dir, "manifest.json")
+    previous = []
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            previous = json.load(f)
+    for path in glob.glob(os.path.join(shard_dir, "shard_*.csv*")):
+        k = int(os.path.basename(path)[6:11])
+        if k >= len(digests) or k >= len(previous) or previous[k] != digests[k] or path.endswith(".tmp"):
+            os.remove(path)
+    with open(manifest, "w") as f:
+        json.dump(digests, f)
+
+
+def run_shards(records, shards, checkpoint, shard_dir, workers=2, esm_threads=None, gat_threads=None,
+               max_retries=2):
+    """Score every shard without an output in shard_dir; return the shard ids that still failed."""
+    os.makedirs(shard_dir, exist_ok=True)
+    _check_manifest(records, shards, checkpoint, shard_dir)
+    pending = [k for k in range(len(shards)) if not os.path.exists(shard_path(shard_dir, k))]
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        if attempt:
+            print(f"Retrying shards {pending} (attempt {attempt + 1})")
+        failed = []
+        # a fresh pool per attempt: a crashed worker breaks the whole pool
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(score_shard, k, [records[i] for i in shards[k]], checkpoint, shard_dir,
+                                   esm_threads, gat_threads): k for k in pending}
+            for future in as_completed(futures):
+                k = futures[future]
+                try:
+                    future.result()
+                    print(f"Shard {k}: {len(shards[k])} proteins done")
+                except Exception as e:
+                    print(f"Shard {k} failed: {e!r}")
+                    failed.append(k)
+        pending = sorted(failed)
+    return pending
+
+
+def merge_shards(shard_dir, num_shards):
+    """{id: score} from all shard outputs."""
+    scores = {}
+    for k in range(num_shards):
+        with open(shard_path(shard_dir, k), newline="") as f:
+            scores.update((row["Accession"], float(row["SolubilityScore"])) for row in csv.DictReader(f))
+    return scores
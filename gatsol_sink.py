@@ -0,0 +1,169 @@
+"""
+Streaming result sinks for GATSol predictions
+- Rows are appended per batch as scores are produced, instead of one write at the end
+- CSV, JSONL and Parquet writers; data is flushed (and fsync'ed) every flush_interval seconds
+- "standard" schema is the benchmarking wrapper's; "raw" is Predict.py's Output.csv
+"""
+import os
+import csv
+import json
+import time
+
+WRAPPER_PREDICTOR_NAME = "GATSol"
+RAW_COLUMNS = ["id", "sequence", "Solubility_hat"]
+STANDARD_COLUMNS = ["Accession", "Sequence", "Predictor", "SolubilityScore", "Probability_Soluble", "Probability_Insoluble"]
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".json": "jsonl", ".parquet": "parquet"}
+
+
+def make_rows(ids, sequences, scores, schema="standard"):
+    if schema == "raw":
+        return [{"id": i, "sequence": s, "Solubility_hat": float(y)} for i, s, y in zip(ids, sequences, scores)]
+    # GATSol outputs a single score, so set probabilities as NA
+    return [{
+        "Accession": i,
+        "Sequence": s,
+        "Predictor": WRAPPER_PREDICTOR_NAME,
+        "SolubilityScore": float(y),
+        "Probability_Soluble": "NA",
+        "Probability_Insoluble": "NA"
+    } for i, s, y in zip(ids, sequences, scores)]
+
+
+class ResultSink:
+    """Base class: buffer rows, write them out on flush(), fsync at most every flush_interval seconds."""
+
+    def __init__(self, path, columns, flush_interval=5.0, append=False):
+        self.path = path
+        self.columns = columns
+        self.flush_interval = flush_interval
+        self.append = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.rows_written = 0
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def write(self, rows):
+        self._buffer.extend(rows)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._write_rows(self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer = []
+        self._sync()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._close()
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def _sync(self):
+        pass
+
+    def _close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _truncate_partial_line(path):
+    # drop a row cut short by a crash so appended rows start on a fresh line
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+
+
+class _TextSink(ResultSink):
+    def __init__(self, path, columns, flush_interval=5.0, append=False):
+        super().__init__(path, columns, flush_interval, append)
+        if self.append:
+            _truncate_partial_line(path)
+        self.file = open(path, "a" if self.append else "w", newline="")
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _close(self):
+        self.file.close()
+
+
+class CSVSink(_TextSink):
+    def __init__(self, path, columns, flush_interval=5.0, append=False):
+        super().__init__(path, columns, flush_interval, append)
+        self.writer = csv.DictWriter(self.file, fieldnames=columns, lineterminator="\n")
+        if not self.append:
+            self.writer.writeheader()
+
+    def _write_rows(self, rows):
+        self.writer.writerows(rows)
+
+
+class JSONLSink(_TextSink):
+    def _write_rows(self, rows):
+        self.file.writelines(json.dumps({c: row[c] for c in self.columns}) + "\n" for row in rows)
+
+
+class ParquetSink(ResultSink):
+    """Each flush writes one row group. The Parquet footer is only written by close(),
+    so use CSV or JSONL when results must survive a crash mid-run."""
+
+    def __init__(self, path, columns, flush_interval=5.0, append=False):
+        if append:
+            raise ValueError("Parquet output cannot be appended to, use CSV or JSONL to resume")
+        super().__init__(path, columns, flush_interval, append=False)
+        self.writer = None
+
+    def _write_rows(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pylist(rows).select(self.columns)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def _close(self):
+        if self.writer is None:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.table({c: [] for c in self.columns}), self.path)
+        else:
+            self.writer.close()
+
+
+def infer_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return FORMATS.get(os.path.splitext(path)[1].lower(), "csv")
+
+
+def open_sink(path, fmt=None, schema="standard", flush_interval=5.0, append=False):
+    columns = RAW_COLUMNS if schema == "raw" else STANDARD_COLUMNS
+    sink_class = {"csv": CSVSink, "jsonl": JSONLSink, "parquet": ParquetSink}[infer_format(path, fmt)]
+    return sink_class(path, columns, flush_interval, append)
+
+
+def written_ids(path, fmt=None, schema="standard"):
+    """Ids already present in a CSV/JSONL output, used to resume an interrupted run."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return set()
+    key, score = ("id", "Solubility_hat") if schema == "raw" else ("Accession", "SolubilityScore")
+    with open(path, newline="") as f:
+        lines = f.read().splitlines(keepends=True)
+    # a crash can leave a partial last row behind; it is rewritten on resume
+    if lines and not lines[-1].endswith("\n"):
+        lines = lines[:-1]
+    if infer_format(path, fmt) == "jsonl":
+        return {json.loads(line)[key] for line in lines if line.strip()}
+    return {row[key] for row in csv.DictReader(lines) if row.get(score)}
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Structure providers for GATSol inputs
+- DirectoryProvider: existing <id>.pdb files; ArchiveProvider: <id>.pdb members of a tar or zip file
+- CommandProvider: an external predictor (e.g. the ESMFold docker image) run on batches of sequences
+- StubProvider: ideal alpha-helix CA traces, for tests without a structure predictor
+- StructureCache: content-addressed PDB store; predicted structures are indexed by
+  (provider, sequence), so a sequence is only predicted once per provider
+- StructureResolver: tries providers in order; predictor calls are length-sorted, batched
+  and limited to max_concurrency at a time
+
+Usage:
+    python gatsol_structures.py --fasta input.fasta --structures dir:pdbs \
+        --structures 'command:docker run --gpus all --rm -v {work_dir}:{work_dir} esmfold-gpu -i {fasta} -o {out_dir}' \
+        --cache structure_cache --out_dir resolved_pdbs
+"""
+import os
+import math
+import time
+import shlex
+import hashlib
+import zipfile
+import tarfile
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from Bio import SeqIO
+from Bio.SeqUtils import seq3
+
+
+def _atomic_write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class StructureCache:
+    """root/objects/<sha256 of the PDB text>.pdb plus root/index/<provider>/<sha256 of the sequence>."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _index_path(self, provider, sequence):
+        return os.path.join(self.root, "index", provider, hashlib.sha256(sequence.upper().encode()).hexdigest())
+
+    def store(self, pdb_text):
+        """Path of the stored PDB text (written once per distinct content)."""
+        digest = hashlib.sha256(pdb_text.encode()).hexdigest()
+        path = os.path.join(self.root, "objects", digest[:2], f"{digest}.pdb")
+        if not os.path.exists(path):
+            _atomic_write(path, pdb_text)
+        return path
+
+    def get(self, provider, sequence):
+        index_path = self._index_path(provider, sequence)
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path) as f:
+            path = os.path.join(self.root, f.read().strip())
+        return path if os.path.exists(path) else None
+
+    def put(self, provider, sequence, pdb_text):
+        path = self.store(pdb_text)
+        _atomic_write(self._index_path(provider, sequence), os.path.relpath(path, self.root))
+        return path
+
+
+class DirectoryProvider:
+    """<pdb_dir>/<id>.pdb."""
+    predicts = False
+
+    def __init__(self, pdb_dir):
+        self.pdb_dir = os.path.abspath(pdb_dir)
+        self.name = f"dir:{self.pdb_dir}"
+
+    def fetch(self, seqs):
+        paths = {sid: os.path.join(self.pdb_dir, f"{sid}.pdb") for sid, _ in seqs}
+        return {sid: path for sid, path in paths.items() if os.path.isfile(path)}
+
+
+class ArchiveProvider:
+    """<id>.pdb members (at any depth) of a .tar, .tar.gz or .zip file."""
+    predicts = False
+
+    def __init__(self, archive):
+        self.archive = os.path.abspath(archive)
+        self.name = f"archive:{self.archive}"
+        if zipfile.is_zipfile(self.archive):
+            with zipfile.ZipFile(self.archive) as z:
+                names = z.namelist()
+        else:
+            with tarfile.open(self.archive) as t:
+                names = [m.name for m in t.getmembers() if m.isfile()]
+        self.members = {os.path.basename(n)[:-4]: n for n in names if n.endswith(".pdb")}
+
+    def fetch(self, seqs):
+        wanted = {sid: self.members[sid] for sid, _ in seqs if sid in self.members}
+        if not wanted:
+            return {}
+        if zipfile.is_zipfile(self.archive):
+            with zipfile.ZipFile(self.archive) as z:
+                return {sid: z.read(name).decode() for sid, name in wanted.items()}
+        with tarfile.open(self.archive) as t:
+            return {sid: t.extractfile(name).read().decode() for sid, name in wanted.items()}
+
+
+class CommandProvider:
+    """External structure predictor run once per batch.
+
+    The command is a template with {fasta} (input FASTA of the batch), {out_dir} (where the
+    command must write <id>.pdb) and {work_dir} (their parent, e.g. for a docker volume).
+    """
+    predicts = True
+
+    def __init__(self, command, name=None):
+        self.command = command
+        self.name = name or "command-" + hashlib.sha256(command.encode()).hexdigest()[:12]
+
+    def fetch(self, seqs):
+        with tempfile.TemporaryDirectory() as work_dir:
+            fasta = os.path.join(work_dir, "input.fasta")
+            out_dir = os.path.join(work_dir, "out")
+            os.makedirs(out_dir)
+            with open(fasta, "w") as f:
+                f.writelines(f">{sid}\n{seq}\n" for sid, seq in seqs)
+            args = [part.format(fasta=fasta, out_dir=out_dir, work_dir=work_dir) for part in shlex.split(self.command)]
+            subprocess.run(args, check=True)
+            found = {}
+            for sid, _ in seqs:
+                path = os.path.join(out_dir, f"{sid}.pdb")
+                if os.path.isfile(path):
+                    with open(path) as f:
+                        found[sid] = f.read()
+            return found
+
+
+class StubProvider:
+    """Ideal alpha-helix CA trace for every sequence (3.8 angstrom CA spacing)."""
+    predicts = True
+    name = "stub"
+
+    def fetch(self, seqs):
+        return {sid: helix_pdb(seq) for sid, seq in seqs}
+
+
+def helix_pdb(sequence, radius=2.3, rise=1.5, turn=100.0):
+    lines = []
+    for i, aa in enumerate(sequence.upper(), start=1):
+        angle = math.radians(turn * i)
+        x, y, z = radius * math.cos(angle), radius * math.sin(angle), rise * i
+        lines.append(f"ATOM  {i:5d}  CA  {seq3(aa).upper():>3} A{i:4d}    {x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00           C\n")
+    return "".join(lines) + "END\n"
+
+
+def make_provider(spec):
+    """Provider from "dir:PATH", "archive:PATH", "command:TEMPLATE" or "stub"."""
+    kind, _, value = spec.partition(":")
+    if kind == "dir":
+        return DirectoryProvider(value)
+    if kind == "archive":
+        return ArchiveProvider(value)
+    if kind == "command":
+        return CommandProvider(value)
+    if kind == "stub":
+        return StubProvider()
+    raise ValueError(f"Unknown structure provider {spec!r}, expected dir:, archive:, command: or stub")
+
+
+class StructureResolver:
+    def __init__(self, providers, cache, batch_size=8, max_concurrency=1):
+        self.providers = providers
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.counts = {}
+
+    def _predict(self, provider, seqs):
+        # one call per distinct sequence; similar lengths share a batch
+        unique = sorted({seq.upper(): (sid, seq) for sid, seq in seqs}.values(), key=lambda r: len(r[1]))
+        batches = [unique[i:i + self.batch_size] for i in range(0, len(unique), self.batch_size)]
+        paths = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            for batch, found in zip(batches, pool.map(provider.fetch, batches)):
+                for sid, seq in batch:
+                    if sid in found:
+                        paths[seq.upper()] = self.cache.put(provider.name, seq, found[sid])
+        return {sid: paths[seq.upper()] for sid, seq in seqs if seq.upper() in paths}
+
+    def resolve(self, seqs):
+        """{id: PDB path} for every sequence some provider could supply."""
+        structures = {}
+        for provider in self.providers:
+            remaining = [(sid, seq) for sid, seq in seqs if sid not in structures]
+            if not remaining:
+                break
+            if provider.predicts:
+                cached = {sid: self.cache.get(provider.name, seq) for sid, seq in remaining}
+                found = {sid: path for sid, path in cached.items() if path}
+                self.counts[f"{provider.name} (cached)"] = len(found)
+                predicted = self._predict(provider, [(sid, seq) for sid, seq in remaining if sid not in found])
+                self.counts[provider.name] = len(predicted)
+                found.update(predicted)
+            else:
+                found = {sid: s if os.path.isfile(s) else self.cache.store(s)
+                         for sid, s in provider.fetch(remaining).items()}
+                self.counts[provider.name] = len(found)
+            structures.update(found)
+        return structures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve a structure for every sequence of a FASTA file.")
+    parser.add_argument("--fasta", required=True, help="Input FASTA file")
+    parser.add_argument("--structures", action="append", required=True,
+                        help="Provider, tried in the given order: dir:PATH, archive:PATH, command:TEMPLATE or stub")
+    parser.add_argument("--cache", required=True, help="Structure cache directory")
+    parser.add_argument("--out_dir", default=None, help="Link the resolved structures here as <id>.pdb")
+    parser.add_argument("--batch_size", type=int, default=8, help="Sequences per predictor call")
+    parser.add_argument("--max_concurrency", type=int, default=1, help="Predictor calls running at the same time")
+    args = parser.parse_args()
+
+    seqs = [(r.id, str(r.seq)) for r in SeqIO.parse(args.fasta, "fasta")]
+    resolver = StructureResolver([make_provider(s) for s in args.structures], StructureCache(args.cache),
+                                 args.batch_size, args.max_concurrency)
+    start = time.perf_counter()
+    structures = resolver.resolve(seqs)
+    print(f"{len(structures)}/{len(seqs)} structures resolved in {time.perf_counter() - start:.2f}s")
+    for name, count in resolver.counts.items():
+        print(f"  {name}: {count}")
+    missing = [sid for sid, _ in seqs if sid not in structures]
+    if missing:
+        print(f"Missing: {', '.join(missing)}")
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+        for sid, path in structures.items():
+            link = os.path.join(args.out_dir, f"{sid}.pdb")
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(path, link)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 import torch
-from torch_geometric.loader import DataLoader
 import os
 import pickle
 from sklearn.model_selection import KFold
@@ -10,6 +9,12 @@ import torch.nn.functional as F
 import torch.nn as nn
 from torch import optim
 import datetime
+import time
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from gatsol_adjacency import adjacency, prepare_graph  # 缓存的有序CSR邻接矩阵
+from gatsol_loader import make_loader, cached_loader  # 后台进程读取并拼接batch，每个batch再搬到GPU
+from gatsol_batching import BucketBatchSampler  # 按节点数装填、长度相近的蛋白分在同一batch
 
 # 定义图神经网络模型
 class GATClassifier(nn.Module):
@@ -20,7 +25,7 @@ class GATClassifier(nn.Module):
         self.lin = nn.Linear(hidden_channels * num_heads, 1)
 
     def forward(self, data):
-        x, edge_index, batch = data.x, data.edge_index, data.batch
+        x, edge_index, batch = data.x, adjacency(data), data.batch
         x = F.relu(self.conv1(x, edge_index))
         x = F.relu(self.conv2(x, edge_index))
         x = global_mean_pool(x, batch)  # Global pooling to obtain a fixed-size representation
@@ -59,8 +64,8 @@ def test(model, device, loader, criterion):
 
 def predictions(model, device, loader):
     model.eval()
-    y_hat = torch.tensor([]).cuda()
-    y_true = torch.tensor([]).cuda()
+    y_hat = torch.tensor([]).to(device)
+    y_true = torch.tensor([]).to(device)
     with torch.no_grad():
         for data in loader:
             data = data.to(device)
@@ -88,7 +93,7 @@ for learning_rate in [0.0000005,0.00000005]:
     for filename in os.listdir(data_path):
         file_path = os.path.join(data_path, filename)
         with open(file_path, 'rb') as f:
-            data = pickle.load(f).to(torch.device('cuda'))
+            data = prepare_graph(pickle.load(f))
         dataset.append(data)
 
     # 设置训练参数
@@ -107,6 +112,8 @@ for learning_rate in [0.0000005,0.00000005]:
     print("...............learning_rate_" + str(learning_rate) + " data loading completed and 5 kFold train started...............")
 
     batch_size = 16
+    eval_cache_dir = None  # 测试折batch的缓存目录 (内存映射，可在不同的参数选择脚本间复用)，None时缓存在内存中
+    max_nodes = None  # 训练batch按节点总数装填 (每轮打乱，长度相近的蛋白放在一起)，None时每个batch固定batch_size个图
 
     # 存储每个 learning_rate 的 r² 值
     r2_values = []
@@ -117,15 +124,17 @@ for learning_rate in [0.0000005,0.00000005]:
     for train_idx, test_idx in kfold.split(dataset):
         k += 1
         # print("...............pkl_" + str(distance) + " : " + str(k) + "/5 kFold is training...............")
-        train_subsampler = torch.utils.data.SubsetRandomSampler(train_idx)
-        test_subsampler = torch.utils.data.SubsetRandomSampler(test_idx)
-
-        train_loader = DataLoader(dataset,
-                                sampler=train_subsampler,
-                                batch_size=batch_size)
-        test_loader = DataLoader(dataset,
-                            sampler=test_subsampler,
-                            batch_size=batch_size)
+        if max_nodes:
+            train_loader = make_loader(dataset, device,
+                                    batch_sampler=BucketBatchSampler(dataset, max_nodes, indices=train_idx, seed=seed))
+        else:
+            train_subsampler = torch.utils.data.SubsetRandomSampler(train_idx)
+
+            train_loader = make_loader(dataset, device,
+                                    sampler=train_subsampler,
+                                    batch_size=batch_size)
+        # 测试折的batch只拼接一次，在各轮和各参数配置间复用
+        test_loader = cached_loader(dataset, device, batch_size=batch_size, indices=test_idx, cache_dir=eval_cache_dir)
         
         # 创建模型实例
         model = GATClassifier(in_channels, hidden_channels, num_heads).to(device)
@@ -144,6 +153,7 @@ for learning_rate in [0.0000005,0.00000005]:
         #开始训练和测试
         best_loss = float('inf')  # 初始最佳损失设为无穷大
 
+        epoch_times = []
         model.train()
         for epoch in range(1, epochs + 1):
             if epoch < 10:
@@ -151,7 +161,9 @@ for learning_rate in [0.0000005,0.00000005]:
                 for param_group in optimizer.param_groups:
                     param_group['lr'] = lr
             optimizer = optim.Adam(model.parameters(), lr=lr)
+            epoch_start = time.perf_counter()
             train(model, device, train_loader, optimizer, criterion)
+            epoch_times.append(time.perf_counter() - epoch_start)
             train_accuracy = test(model, device, train_loader, criterion)
             test_accuracy = test(model, device, test_loader, criterion)
             if test_accuracy < best_loss:
@@ -201,7 +213,7 @@ for learning_rate in [0.0000005,0.00000005]:
         r2_per_distance.append(r2)
 
         # 打印当前时间
-        print(f'{current_time_str} R2: {r2:.3f}, test loss: {test_loss:.3f}, Pearson: {pearson[0]:.3f}, Accuracy: {binary_acc:.3f}, Precision: {precision:.3f}, Recall: {recall:.3f}, F1: {f1:.3f}, AUC: {auc:.3f}, MCC: {mcc:.3f}, Sensitivity: {sensitivity:.3f}, Specificity: {specificity:.3f}')
+        print(f'{current_time_str} R2: {r2:.3f}, test loss: {test_loss:.3f}, Pearson: {pearson[0]:.3f}, Accuracy: {binary_acc:.3f}, Precision: {precision:.3f}, Recall: {recall:.3f}, F1: {f1:.3f}, AUC: {auc:.3f}, MCC: {mcc:.3f}, Sensitivity: {sensitivity:.3f}, Specificity: {specificity:.3f}, Epoch time: {np.mean(epoch_times):.1f}s, Steps/s: {len(train_loader) / np.mean(epoch_times):.2f}')
     
         del model
         torch.cuda.empty_cache()  # 清空GPU缓存（如果在GPU上运行）
@@ -1,19 +1,25 @@
 import torch
-from torch_geometric.loader import DataLoader
 import os
 import pickle
 from sklearn.model_selection import KFold
 import numpy as np
 import random
 from torch_geometric.nn import global_mean_pool, GATConv
-import torch.nn.functional as F
 import torch.nn as nn
 from torch import optim
 import datetime
+import time
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from gatsol_adjacency import adjacency, prepare_graph  # 缓存的有序CSR邻接矩阵
+from gatsol_loader import make_loader, cached_loader  # 后台进程读取并拼接batch，每个batch再搬到GPU
+from gatsol_batching import BucketBatchSampler  # 按节点数装填、长度相近的蛋白分在同一batch
+from gatsol_model import conv_layer  # 可选的逐层激活重计算
 
 class GATClassifier(nn.Module):
-    def __init__(self, in_channels, hidden_channels, num_heads, num_layers):
+    def __init__(self, in_channels, hidden_channels, num_heads, num_layers, checkpoint_activations=False):
         super(GATClassifier, self).__init__()
+        self.checkpoint_activations = checkpoint_activations
         self.convs = nn.ModuleList()
         for i in range(num_layers):
             if i == 0:
@@ -23,9 +29,9 @@ class GATClassifier(nn.Module):
         self.lin = nn.Linear(hidden_channels * num_heads, 1)
 
     def forward(self, data):
-        x, edge_index, batch = data.x, data.edge_index, data.batch
+        x, edge_index, batch = data.x, adjacency(data), data.batch
         for conv in self.convs:
-            x = F.relu(conv(x, edge_index))
+            x = conv_layer(conv, x, edge_index, checkpointed=self.checkpoint_activations and self.training)
         x = global_mean_pool(x, batch)
         x = self.lin(x)
         return x.squeeze()
@@ -62,8 +68,8 @@ def test(model, device, loader, criterion):
 
 def predictions(model, device, loader):
     model.eval()
-    y_hat = torch.tensor([]).cuda()
-    y_true = torch.tensor([]).cuda()
+    y_hat = torch.tensor([]).to(device)
+    y_true = torch.tensor([]).to(device)
     with torch.no_grad():
         for data in loader:
             data = data.to(device)
@@ -91,10 +97,12 @@ dataset = []  # data数据对象的list集合
 for filename in os.listdir(data_path):
     file_path = os.path.join(data_path, filename)
     with open(file_path, 'rb') as f:
-        data = pickle.load(f).to(torch.device('cuda'))
+        data = prepare_graph(pickle.load(f))
     dataset.append(data)
 
 batch_size = 16
+eval_cache_dir = None  # 测试折batch的缓存目录 (内存映射，可在不同的参数选择脚本间复用)，None时缓存在内存中
+max_nodes = None  # 训练batch按节点总数装填 (每轮打乱，长度相近的蛋白放在一起)，None时每个batch固定batch_size个图
 # 打乱数据集的顺序
 random.shuffle(dataset)
 
@@ -107,6 +115,7 @@ in_channels = 1300  # 输入特征的维度
 hidden_channels = 512  # 隐层特征的维度
 num_classes = 1  # 分类类别的数量
 num_heads = 6  # 注意力头的数量
+checkpoint_activations = False  # 逐层重计算GATConv激活，以时间换显存，用于更深/更宽的模型或更大的batch
 
 for num_hidden_layers in range(1,11):
     
@@ -119,17 +128,19 @@ for num_hidden_layers in range(1,11):
     k = 0   #计数第几折
     r2_per_distance = []   # 存储每个 num_hidden_layers 的五折交叉验证结果
     for train_idx, test_idx in kfold.split(dataset):
-        model = GATClassifier(in_channels, hidden_channels, num_heads, num_layers = num_hidden_layers).to(device)
+        model = GATClassifier(in_channels, hidden_channels, num_heads, num_layers = num_hidden_layers, checkpoint_activations = checkpoint_activations).to(device)
         k += 1
-        train_subsampler = torch.utils.data.SubsetRandomSampler(train_idx)
-        test_subsampler = torch.utils.data.SubsetRandomSampler(test_idx)
-
-        train_loader = DataLoader(dataset,
-                                sampler=train_subsampler,
-                                batch_size=batch_size)
-        test_loader = DataLoader(dataset,
-                            sampler=test_subsampler,
-                            batch_size=batch_size)
+        if max_nodes:
+            train_loader = make_loader(dataset, device,
+                                    batch_sampler=BucketBatchSampler(dataset, max_nodes, indices=train_idx, seed=seed))
+        else:
+            train_subsampler = torch.utils.data.SubsetRandomSampler(train_idx)
+
+            train_loader = make_loader(dataset, device,
+                                    sampler=train_subsampler,
+                                    batch_size=batch_size)
+        # 测试折的batch只拼接一次，在各轮和各参数配置间复用
+        test_loader = cached_loader(dataset, device, batch_size=batch_size, indices=test_idx, cache_dir=eval_cache_dir)
         
         #初始化参数
         for m in model.modules():
@@ -145,6 +156,7 @@ for num_hidden_layers in range(1,11):
         #开始训练和测试
         best_loss = float('inf')  # 初始最佳损失设为无穷大
 
+        epoch_times = []
         model.train()
         for epoch in range(1, epochs + 1):
             if epoch < 10:
@@ -152,7 +164,9 @@ for num_hidden_layers in range(1,11):
                 for param_group in optimizer.param_groups:
                     param_group['lr'] = lr
             optimizer = optim.Adam(model.parameters(), lr=lr)
+            epoch_start = time.perf_counter()
             train(model, device, train_loader, optimizer, criterion)
+            epoch_times.append(time.perf_counter() - epoch_start)
             train_accuracy = test(model, device, train_loader, criterion)
             test_accuracy = test(model, device, test_loader, criterion)
             if test_accuracy < best_loss:
@@ -202,7 +216,7 @@ for num_hidden_layers in range(1,11):
         r2_per_distance.append(r2)
 
         # 打印当前时间
-        print(f'{current_time_str} R2: {r2:.3f}, test loss: {test_loss:.3f}, Pearson: {pearson[0]:.3f}, Accuracy: {binary_acc:.3f}, Precision: {precision:.3f}, Recall: {recall:.3f}, F1: {f1:.3f}, AUC: {auc:.3f}, MCC: {mcc:.3f}, Sensitivity: {sensitivity:.3f}, Specificity: {specificity:.3f}')
+        print(f'{current_time_str} R2: {r2:.3f}, test loss: {test_loss:.3f}, Pearson: {pearson[0]:.3f}, Accuracy: {binary_acc:.3f}, Precision: {precision:.3f}, Recall: {recall:.3f}, F1: {f1:.3f}, AUC: {auc:.3f}, MCC: {mcc:.3f}, Sensitivity: {sensitivity:.3f}, Specificity: {specificity:.3f}, Epoch time: {np.mean(epoch_times):.1f}s, Steps/s: {len(train_loader) / np.mean(epoch_times):.2f}')
 
         del model
         torch.cuda.empty_cache()  # 清空GPU缓存（如果在GPU上运行）
@@ -1,17 +1,26 @@
 import os
+import sys
+import json
+import time
+import argparse
 import pandas as pd
 import torch
 import numpy as np
-from torch_geometric.data import DataLoader
 import random
 import torch.nn as nn
 import torch.optim as optim
-from torch_geometric.nn import global_mean_pool
-from torch_geometric.nn import GATConv
-import torch.nn.functional as F
+from torch.utils.data.distributed import DistributedSampler
 from sklearn.metrics import roc_curve
 from sklearn import metrics
 from scipy.stats import pearsonr
+from gatsol_model import GATClassifier
+from gatsol_adjacency import prepare_dataset
+from gatsol_batching import BucketBatchSampler, CostModel, MemoryBudgetBatchSampler
+from gatsol_loader import make_loader, cached_loader
+from gatsol_mmap import open_datasets
+from gatsol_eval import PeakMemory, RunningMetrics, EvalSchedule, metrics as split_metrics
+from gatsol_distributed import init_distributed, wrap_model, all_reduce_sum
+from gatsol_resume import atomic_save, save_training_state, load_training_state
 
 os.environ['CUDA_LAUNCH_BLOCKING'] = '1' 
 
@@ -28,13 +37,47 @@ def set_seed(seed):
     # torch.use_deterministic_algorithms(True)
     os.environ["CUBLAS_WORKSPACE_CONFIG"] = ":4096:8"
 
+parser = argparse.ArgumentParser(description="Re-train GATSol on dataset/GATSol_datasets.pkl.")
+parser.add_argument("--dataset", default='./dataset/GATSol_datasets.pkl', help="Pickled dict of train/test/val/val1 graphs, or a directory converted by gatsol_mmap.py")
+parser.add_argument("--save", default='/home/bli/GATSol/check_point/best_model.pt', help="Where the best model is written")
+parser.add_argument("--epochs", type=int, default=10, help="训练轮数")
+parser.add_argument("--patience", type=int, default=None, help="Stop after this many evaluations without the test loss improving by more than --min_delta (default: run all epochs)")
+parser.add_argument("--min_delta", type=float, default=0.0, help="Smallest test-loss decrease that resets the --patience counter")
+parser.add_argument("--eval_every", type=int, default=None, help="Evaluate test/val/val1 every k epochs (default: every epoch unless --eval_interval is given)")
+parser.add_argument("--eval_interval", type=float, default=None, help="Evaluate once this many seconds have passed since the last evaluation")
+parser.add_argument("--eval_cache", default=None, help="Keep the collated test/val/val1 batches here, memory-mapped and reused by later runs (default: in memory)")
+parser.add_argument("--state", default=None, help="Full training state written after every epoch (default: <save without .pt>_state.pt)")
+parser.add_argument("--resume", action="store_true", help="Continue from --state if it exists")
+parser.add_argument("--lr", type=float, default=0.000002, help="学习率")
+parser.add_argument("--lowrank", default=None, help="Fine-tune a compressed checkpoint written by gatsol_lowrank.py")
+parser.add_argument("--memory_budget", type=float, default=None, help="Form batches by predicted activation memory (MB) instead of batch_size = 4")
+parser.add_argument("--cost_model", default=None, help="Cost model JSON from 'gatsol_batching.py calibrate --mode train' (default: estimate from the model config)")
+parser.add_argument("--max_nodes", type=int, default=None, help="Form shuffled batches of similar-sized proteins with at most this many nodes instead of batch_size = 4")
+parser.add_argument("--max_edges", type=int, default=None, help="With --max_nodes: also cap the edges (incl. self-loops) per batch")
+parser.add_argument("--num_workers", type=int, default=None, help="Background processes collating batches (default: up to 2, leaving one core for training)")
+parser.add_argument("--coo", action="store_true", help="Message passing over the plain edge_index instead of the cached CSR adjacency")
+parser.add_argument("--precision", choices=["fp32", "bf16"], default="fp32", help="bf16: autocast the training forward/backward to bfloat16 (fp32 weights, optimizer and loss)")
+parser.add_argument("--checkpoint_activations", action="store_true", help="Recompute each GATConv layer during backward instead of storing its activations (less memory, more time)")
+parser.add_argument("--backend", default="gloo", help="torch.distributed backend when launched by torchrun (one process per rank)")
+parser.add_argument("--metrics_out", default=None, help="Write the final R2/Pearson/AUC per split, epoch time and peak memory as JSON")
+parser.add_argument("--reference_metrics", default=None, help="--metrics_out JSON of a reference run (e.g. fp32); exit 1 if R2 or AUC differ by more than --tolerance")
+parser.add_argument("--tolerance", type=float, default=0.02, help="Allowed absolute R2/AUC difference to --reference_metrics")
+args = parser.parse_args()
+
+# torchrun启动时每个进程训练一部分图，梯度在各进程间求和平均；否则为单进程训练
+rank, world_size = init_distributed(args.backend)
 set_seed(2024)
 
 print("data loading...............")
 
 # 读入dataset文件
-with open('./dataset/GATSol_datasets.pkl', 'rb') as f:
-    datasets = torch.load(f)
+memmap = os.path.isdir(args.dataset)
+if memmap:
+    # 内存映射的数据集，按需读取每个图，无需整体反序列化
+    datasets = open_datasets(args.dataset, adjacency=not args.coo)
+else:
+    with open(args.dataset, 'rb') as f:
+        datasets = torch.load(f)
 
 # 获取特定数据集
 train_dataset = datasets['train']
@@ -42,52 +85,75 @@ test_dataset = datasets['test']
 val_dataset = datasets['val']
 val1_dataset = datasets['val1']
 
+# 内存映射的数据集在读取每个图时构建 adj_t (--coo 时不构建)
+if args.coo and not memmap:
+    for split in (train_dataset, test_dataset, val_dataset, val1_dataset):
+        for data in split:
+            if 'adj_t' in data:
+                del data.adj_t
+elif not memmap:
+    # 只对尚未缓存CSR邻接矩阵的图构建一次 (gatsol_adjacency.py 可预先持久化)
+    train_dataset, test_dataset, val_dataset, val1_dataset = (prepare_dataset(split) for split in (
+        train_dataset, test_dataset, val_dataset, val1_dataset))
+
 batch_size = 4
-train_loader = DataLoader(train_dataset, batch_size = batch_size, shuffle=True)
-test_loader = DataLoader(test_dataset, batch_size = batch_size, shuffle=False)
-val_loader = DataLoader(val_dataset, batch_size = batch_size, shuffle=False)
-val1_loader = DataLoader(val1_dataset, batch_size = batch_size, shuffle=False)
+# 后台进程读取并拼接batch (GPU训练时放入锁页内存)，每个batch再搬到device
+# 测试/验证集的batch固定不变，第一次评估时拼接一次并缓存，之后每轮直接复用
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+if args.memory_budget:
+    # 按预测的激活显存装填batch，小蛋白多装、大蛋白少装
+    cost_model = CostModel.load(args.cost_model) if args.cost_model else CostModel.from_config()
+    budget = args.memory_budget * 2 ** 20
+    train_sampler = MemoryBudgetBatchSampler(train_dataset, cost_model, budget, shuffle=True, seed=2024, num_replicas=world_size, rank=rank)
+    train_loader = make_loader(train_dataset, device, batch_sampler=train_sampler, num_workers=args.num_workers)
+    test_loader = cached_loader(test_dataset, device, batch_sampler=MemoryBudgetBatchSampler(test_dataset, cost_model, budget), cache_dir=args.eval_cache, num_workers=args.num_workers)
+    val_loader = cached_loader(val_dataset, device, batch_sampler=MemoryBudgetBatchSampler(val_dataset, cost_model, budget), cache_dir=args.eval_cache, num_workers=args.num_workers)
+    val1_loader = cached_loader(val1_dataset, device, batch_sampler=MemoryBudgetBatchSampler(val1_dataset, cost_model, budget), cache_dir=args.eval_cache, num_workers=args.num_workers)
+    print(f"{cost_model}, {len(train_loader)} train batches within {args.memory_budget:.0f} MB")
+elif args.max_nodes:
+    # 按节点/边数装填batch：每轮打乱后分池，池内按长度排序，长度相近的蛋白放在同一个batch
+    train_sampler = BucketBatchSampler(train_dataset, args.max_nodes, args.max_edges, shuffle=True, seed=2024, num_replicas=world_size, rank=rank)
+    train_loader = make_loader(train_dataset, device, batch_sampler=train_sampler, num_workers=args.num_workers)
+    test_loader = cached_loader(test_dataset, device, batch_sampler=BucketBatchSampler(test_dataset, args.max_nodes, args.max_edges, shuffle=False), cache_dir=args.eval_cache, num_workers=args.num_workers)
+    val_loader = cached_loader(val_dataset, device, batch_sampler=BucketBatchSampler(val_dataset, args.max_nodes, args.max_edges, shuffle=False), cache_dir=args.eval_cache, num_workers=args.num_workers)
+    val1_loader = cached_loader(val1_dataset, device, batch_sampler=BucketBatchSampler(val1_dataset, args.max_nodes, args.max_edges, shuffle=False), cache_dir=args.eval_cache, num_workers=args.num_workers)
+    print(f"~{len(train_loader)} train batches within {args.max_nodes} nodes" + (f", {args.max_edges} edges" if args.max_edges else ""))
+else:
+    if world_size > 1:
+        # 每个进程取训练集的一份，每轮按 seed + epoch 重新打乱
+        train_sampler = DistributedSampler(train_dataset, num_replicas=world_size, rank=rank, shuffle=True, seed=2024)
+        train_loader = make_loader(train_dataset, device, batch_size = batch_size, sampler=train_sampler, num_workers=args.num_workers)
+    else:
+        train_sampler = None
+        train_loader = make_loader(train_dataset, device, batch_size = batch_size, shuffle=True, num_workers=args.num_workers)
+    test_loader = cached_loader(test_dataset, device, batch_size = batch_size, cache_dir=args.eval_cache, num_workers=args.num_workers)
+    val_loader = cached_loader(val_dataset, device, batch_size = batch_size, cache_dir=args.eval_cache, num_workers=args.num_workers)
+    val1_loader = cached_loader(val1_dataset, device, batch_size = batch_size, cache_dir=args.eval_cache, num_workers=args.num_workers)
 print("data loaded !!!!!!!!!!")
 
-# 定义图神经网络模型
-class GATClassifier(nn.Module):
-    def __init__(self, in_channels, hidden_channels, num_heads, num_layers):
-        super(GATClassifier, self).__init__()
-        self.convs = nn.ModuleList()
-        for i in range(num_layers):
-            if i == 0:
-                self.convs.append(GATConv(in_channels, hidden_channels, heads=num_heads))
-            else:
-                self.convs.append(GATConv(hidden_channels * num_heads, hidden_channels, heads=num_heads))
-        self.lin1 = nn.Linear(hidden_channels * num_heads, 128)
-        self.lin2 = nn.Linear(128, 1)
-
-    def forward(self, data):
-        x, edge_index, batch = data.x, data.edge_index, data.batch
-        for conv in self.convs:
-            x = F.relu(conv(x, edge_index))
-        x = global_mean_pool(x, batch)
-        x = F.relu(self.lin1(x))
-        x = self.lin2(x)
-        # x = self.lin1(x)
-        return x.squeeze()
+if args.precision == 'bf16' and device.type == 'cuda' and not torch.cuda.is_bf16_supported():
+    parser.error("--precision bf16 needs a GPU with bfloat16 support")
+
+def autocast():
+    # bf16只用于前向/反向的计算，参数、梯度和Adam状态仍为fp32
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=args.precision == 'bf16')
 
 # 定义训练函数
 def train(model, device, loader, optimizer, criterion):
     model.train()
     
-    total_loss = 0
+    running = RunningMetrics()  # 训练损失和指标在训练过程中累计，无需再遍历一次训练集
     for data in loader:
         data = data.to(device)
         optimizer.zero_grad()
-        output = model(data)
+        with autocast():
+            output = model(data)
+        # MSE求和在fp32中计算
         loss = criterion(output.float(), data.y.float())
         loss.backward()
         optimizer.step()
-        total_loss += loss.item()
-    
-    avg_loss = total_loss / len(loader.dataset)    
-    return avg_loss
+        running.update(output.float(), data.y)
+    return running
 
 
 # 定义测试函数
@@ -104,8 +170,8 @@ def test(model, device, loader, criterion):
 
 def predictions(model, device, loader):
     model.eval()
-    y_hat = torch.tensor([]).cuda()
-    y_true = torch.tensor([]).cuda()
+    y_hat = torch.tensor([]).to(device)
+    y_true = torch.tensor([]).to(device)
     with torch.no_grad():
         for data in loader:
             data = data.to(device)
@@ -118,7 +184,6 @@ def predictions(model, device, loader):
 
 
 # 设置训练参数
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 in_channels = 1300  # 输入特征的维度
 hidden_channels = 1024  # 隐层特征的维度
 num_classes = 1  # 分类类别的数量
@@ -126,44 +191,108 @@ num_heads = 16  # 注意力头的数量
 num_layers = 2  # 网络层数
 
 # 创建模型实例
-model = GATClassifier(in_channels, hidden_channels, num_heads, num_layers).to(device)
-
-#初始化参数
-for m in model.modules():
-    if isinstance(m, nn.Linear):
-        nn.init.kaiming_uniform_(m.weight)
+if args.lowrank:
+    # 低秩压缩模型的短期微调，保留SVD分解得到的初始权重
+    from gatsol_lowrank import load_compressed, save_compressed
+    model = load_compressed(args.lowrank, device)
+    model.checkpoint_activations = args.checkpoint_activations
+else:
+    model = GATClassifier(in_channels, hidden_channels, num_heads, num_layers, args.checkpoint_activations).to(device)
+
+    #初始化参数
+    for m in model.modules():
+        if isinstance(m, nn.Linear):
+            nn.init.kaiming_uniform_(m.weight)
+
+def save_model(model, path):
+    # 先写临时文件再重命名，中断时不会留下不完整的模型文件
+    if args.lowrank:
+        atomic_save(model, path, save_compressed)
+    else:
+        atomic_save(model.state_dict(), path)
+
+def load_weights(model, path):
+    state = torch.load(path)
+    model.load_state_dict(state['state_dict'] if args.lowrank else state)
 
 # 定义损失函数和优化器
-initial_lr = 0.000002 # 学习率
-epochs = 10  # 训练轮数
+initial_lr = args.lr # 学习率
+epochs = args.epochs  # 训练轮数
 criterion = nn.MSELoss(reduction='sum')
 optimizer = optim.Adam(model.parameters(), lr=initial_lr)
 
 #开始训练和测试
 best_loss = float('inf')  # 初始最佳损失设为无穷大
-
-print('Training start...............')
+bad_epochs = 0  # 测试损失未改善的评估次数 (早停)
+stopped = False
+start_epoch = 1
+epoch_times, peak_mbs = [], []
+state_path = args.state or os.path.splitext(args.save)[0] + '_state.pt'
+if args.resume and os.path.exists(state_path):
+    # 恢复模型、优化器、随机数状态和训练进度，从下一轮继续
+    progress = load_training_state(state_path, model, optimizer, train_loader, device)
+    start_epoch, best_loss, bad_epochs, stopped = progress['epoch'] + 1, progress['best_loss'], progress['bad_epochs'], progress['stopped']
+    epoch_times, peak_mbs = progress['epoch_times'], progress['peak_mbs']
+    if rank == 0:
+        print(f'Resumed from {state_path} after epoch {progress["epoch"]}')
+
+if rank == 0:
+    print(f'Training start ({args.precision}, {world_size} process{"es" if world_size > 1 else ""})...............')
+train_model = wrap_model(model, world_size)  # 多进程时由DistributedDataParallel同步梯度
+evaluate_now = EvalSchedule(args.eval_every, args.eval_interval, last_epoch=epochs)
 model.train()
-for epoch in range(1, epochs + 1):
+for epoch in range(start_epoch, epochs + 1):
+    if stopped:
+        break
+    if isinstance(train_sampler, DistributedSampler):
+        train_sampler.set_epoch(epoch)
     if epoch < 10:
         lr = initial_lr / 2
         for param_group in optimizer.param_groups:
             param_group['lr'] = lr
-    optimizer = optim.Adam(model.parameters(), lr=lr)
-    train(model, device, train_loader, optimizer, criterion)
-    train_accuracy = test(model, device, train_loader, criterion)
-    test_accuracy = test(model, device, test_loader, criterion)
-    val_accuracy = test(model, device, val_loader, criterion)
-    val1_accuracy = test(model, device, val1_loader, criterion)
-    if test_accuracy < best_loss:
-        best_loss = test_accuracy
-        torch.save(model.state_dict(), '/home/bli/GATSol/check_point/best_model.pt')
-    print(f'Epoch: {epoch}, Train_Loss: {train_accuracy:.8f}, Test_Loss: {test_accuracy:.8f}, ValLoss: {val_accuracy:.8f}, Val1Loss: {val1_accuracy:.8f}')
+    epoch_start = time.perf_counter()
+    with PeakMemory(device) as peak:
+        running = train(train_model, device, train_loader, optimizer, criterion)
+    epoch_time = time.perf_counter() - epoch_start
+    epoch_times.append(epoch_time)
+    peak_mbs.append(peak.peak_mb)
+    # 各进程训练过程中累计的损失与指标求和 (模型在一轮中不断更新，与轮末重新评估的结果略有不同)
+    running.sums = all_reduce_sum(running.sums, world_size)
+    train_metrics = running.result()
+    line = f'Epoch: {epoch}, Train_Loss: {train_metrics["Loss"]:.8f}, Train_R2: {train_metrics["R2"]:.4f}'
+    timing = f'Time: {epoch_time:.1f}s, Steps/s: {len(train_loader) / epoch_time:.2f}, Graphs/s: {len(train_dataset) / epoch_time:.1f}, Peak: {peak.peak_mb:.0f} MB'
+    if rank == 0 and not evaluate_now(epoch):
+        print(f'{line}, {timing}')
+    elif rank == 0:
+        # 测试/验证、最优模型的选择和保存只在rank 0进行，评估频率由 --eval_every / --eval_interval 决定
+        eval_start = time.perf_counter()
+        test_accuracy = test(model, device, test_loader, criterion)
+        val_accuracy = test(model, device, val_loader, criterion)
+        val1_accuracy = test(model, device, val1_loader, criterion)
+        bad_epochs = 0 if test_accuracy < best_loss - args.min_delta else bad_epochs + 1
+        if test_accuracy < best_loss:
+            best_loss = test_accuracy
+            save_model(model, args.save)
+        stopped = args.patience is not None and bad_epochs >= args.patience
+        print(f'{line}, Test_Loss: {test_accuracy:.8f}, ValLoss: {val_accuracy:.8f}, Val1Loss: {val1_accuracy:.8f}, {timing}, Eval: {time.perf_counter() - eval_start:.1f}s')
+        if stopped:
+            print(f'Early stopping: test loss has not improved for {bad_epochs} evaluations')
+        evaluate_now.mark()
+    if rank == 0:
+        save_training_state(state_path, model, optimizer, train_loader, epoch=epoch, best_loss=best_loss,
+                            bad_epochs=bad_epochs, stopped=stopped, epoch_times=epoch_times, peak_mbs=peak_mbs)
+    # rank 0 决定是否早停，其余进程随之停止
+    stopped = all_reduce_sum(float(stopped), world_size) > 0
 
 # print('Seed = ' +  str(seed) + ' Training finished.')
 
+if world_size > 1:
+    torch.distributed.destroy_process_group()
+    if rank != 0:
+        sys.exit(0)
+
 
-model.load_state_dict(torch.load("/home/bli/GATSol/check_point/best_model.pt"))
+load_weights(model, args.save)
 model.eval()
 test_loss = test(model, device, test_loader, criterion)
 val_loss = test(model, device, val_loader, criterion)
@@ -206,4 +335,29 @@ def binary_evaluate(y_true, y_hat, cut_off = 0.5):
 
 binary_evaluate(y_true, y_hat, cut_off = 0.5)
 binary_evaluate(val_true, val_hat, cut_off = 0.5)
-binary_evaluate(val1_true, val1_hat, cut_off = 0.5)
\ No newline at end of file
+binary_evaluate(val1_true, val1_hat, cut_off = 0.5)
+
+# 最终指标 (测试与验证始终用fp32权重计算)，可与参考运行 (如fp32) 对比
+final_metrics = {split: {k: float(v) for k, v in split_metrics(true, hat).items() if k in ('R2', 'Pearson', 'AUC')}
+                 for split, (true, hat) in {'test': (y_true, y_hat), 'val': (val_true, val_hat),
+                                            'val1': (val1_true, val1_hat)}.items()}
+# 第一轮包含数据读入和分配器预热，有多轮时不计入平均时间和峰值内存
+mean_epoch_time = float(np.mean(epoch_times[1:] or epoch_times))
+final_metrics.update(precision=args.precision, world_size=world_size, epoch_time=mean_epoch_time,
+                     graphs_per_s=len(train_dataset) / mean_epoch_time, peak_mb=float(max(peak_mbs[1:] or peak_mbs)))
+print(f'{args.precision}: mean epoch time {final_metrics["epoch_time"]:.1f}s, peak training memory {final_metrics["peak_mb"]:.0f} MB')
+if args.metrics_out:
+    with open(args.metrics_out, 'w') as f:
+        json.dump(final_metrics, f, indent=2)
+if args.reference_metrics:
+    with open(args.reference_metrics) as f:
+        reference = json.load(f)
+    failed = False
+    for split in ('test', 'val', 'val1'):
+        for name in ('R2', 'AUC'):
+            diff = abs(final_metrics[split][name] - reference[split][name])
+            failed |= diff > args.tolerance  # NaN (单一类别的AUC) 不计为失败
+            print(f'{split} {name}: {final_metrics[split][name]:.4f} vs {reference[split][name]:.4f} ({reference["precision"]}), diff {diff:.4f}')
+    print(f'Within tolerance {args.tolerance}' if not failed else f'Exceeds tolerance {args.tolerance}')
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,53 @@
+import contextlib
+import types
+
+import numpy as np
+import torch
+
+import gatsol_adjacency
+from gatsol_model import build_model
+from gatsol_mutscan import MutationalScan
+from gatsol_pipeline import AMINO_ACIDS
+
+
+class FakeFeatures:
+    """BLOSUM62 lookup and ESM embeddings replaced by fixed random tables."""
+
+    def __init__(self):
+        generator = torch.Generator().manual_seed(0)
+        self.table = torch.randn(len(AMINO_ACIDS), 20, generator=generator)
+        self.embedding = torch.randn(len(AMINO_ACIDS), 1280, generator=generator)
+
+    def blosum_table(self):
+        return self.table
+
+    def blosum62(self, sequence):
+        return self.table[[AMINO_ACIDS.index(aa) for aa in sequence]]
+
+    def esm(self, records):
+        return [self.embedding[[AMINO_ACIDS.index(aa) for aa in seq]] for _, seq in records]
+
+
+def fake_pipeline():
+    torch.manual_seed(0)
+    return types.SimpleNamespace(features=FakeFeatures(), model=build_model("cpu", 1300, 16, 2, 2).eval(),
+                                 device=torch.device("cpu"), threshold=8.0,
+                                 _timed=lambda stage: contextlib.nullcontext())
+
+
+def helix(length):
+    # ideal alpha-helix CA trace: 1.5 A rise and 100 degrees per residue
+    angles = np.radians(100.0 * np.arange(length))
+    return np.stack([2.3 * np.cos(angles), 2.3 * np.sin(angles), 1.5 * np.arange(length)], axis=1)
+
+
+def test_scan_without_adj_t(monkeypatch):
+    # torch-geometric < 2.4 without torch-sparse: prepare_graph attaches no adj_t
+    monkeypatch.setattr(gatsol_adjacency, "CSR_AVAILABLE", False)
+    sequence = "MKTAYIAK"
+    scan = MutationalScan(fake_pipeline(), max_batch_nodes=40, chunk_size=16)
+    wt_score, matrix = scan.run("wt", sequence, helix(len(sequence)), positions="2-3")
+    assert scan.num_mutants == 38
+    assert list(matrix.index) == [2, 3]
+    assert matrix.loc[2, "K"] == wt_score
+    assert all(np.isfinite(float(matrix.loc[p, aa])) for p in (2, 3) for aa in AMINO_ACIDS)
@@ -1,4 +1,5 @@
 import os
+import time
 import pandas as pd
 import torch
 import numpy as np
@@ -7,7 +8,8 @@ import warnings
 warnings.filterwarnings("ignore")
 import pickle
 from tqdm import tqdm
-from torch_geometric.data import DataLoader
+from gatsol_loader import make_loader
+from gatsol_eval import RunningMetrics, EvalSchedule
 import random
 import torch.nn as nn
 import torch.optim as optim
@@ -46,35 +48,37 @@ val1_path = "/home/bli/homology/dataset/Scerevisiae/afblast_371/afpkl_371"
 for filename in os.listdir(train_path):
   file_path = os.path.join(train_path, filename)
   with open(file_path, 'rb') as f:
-    data = pickle.load(f).to(torch.device('cuda'))
+    data = pickle.load(f)
   train_dataset.append(data)
 
 for filename in os.listdir(test_path):
   file_path = os.path.join(test_path, filename)
   with open(file_path, 'rb') as f:
-    data = pickle.load(f).to(torch.device('cuda'))
+    data = pickle.load(f)
   test_dataset.append(data)
 
 for filename in os.listdir(val_path):
   file_path = os.path.join(val_path, filename)
   with open(file_path, 'rb') as f:
-    data = pickle.load(f).to(torch.device('cuda'))
+    data = pickle.load(f)
   val_dataset.append(data)
 
 for filename in os.listdir(val1_path):
   file_path = os.path.join(val1_path, filename)
   with open(file_path, 'rb') as f:
-    data = pickle.load(f).to(torch.device('cuda'))
+    data = pickle.load(f)
   val1_dataset.append(data)
 
 # 打乱数据集的顺序
 random.shuffle(train_dataset)
 
 batch_size = 4
-train_loader = DataLoader(train_dataset, batch_size = batch_size, shuffle=True)
-test_loader = DataLoader(test_dataset, batch_size = batch_size, shuffle=False)
-val_loader = DataLoader(val_dataset, batch_size = batch_size, shuffle=False)
-val1_loader = DataLoader(val1_dataset, batch_size = batch_size, shuffle=False)
+# 后台进程读取并拼接batch (锁页内存)，训练时每个batch再搬到GPU
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+train_loader = make_loader(train_dataset, device, batch_size = batch_size, shuffle=True)
+test_loader = make_loader(test_dataset, device, batch_size = batch_size, shuffle=False)
+val_loader = make_loader(val_dataset, device, batch_size = batch_size, shuffle=False)
+val1_loader = make_loader(val1_dataset, device, batch_size = batch_size, shuffle=False)
 print("data loaded !!!!!!!!!!")
 
 # 定义图神经网络模型
@@ -104,7 +108,7 @@ class GATClassifier(nn.Module):
 def train(model, device, loader, optimizer, criterion):
     model.train()
     
-    total_loss = 0
+    running = RunningMetrics()  # 训练损失和指标在训练过程中累计，无需再遍历一次训练集
     for data in loader:
         data = data.to(device)
         optimizer.zero_grad()
@@ -112,10 +116,8 @@ def train(model, device, loader, optimizer, criterion):
         loss = criterion(output.float(), data.y.float())
         loss.backward()
         optimizer.step()
-        total_loss += loss.item()
-    
-    avg_loss = total_loss / len(loader.dataset)    
-    return avg_loss
+        running.update(output.float(), data.y)
+    return running
 
 
 # 定义测试函数
@@ -132,8 +134,8 @@ def test(model, device, loader, criterion):
 
 def predictions(model, device, loader):
     model.eval()
-    y_hat = torch.tensor([]).cuda()
-    y_true = torch.tensor([]).cuda()
+    y_hat = torch.tensor([]).to(device)
+    y_true = torch.tensor([]).to(device)
     with torch.no_grad():
         for data in loader:
             data = data.to(device)
@@ -146,7 +148,6 @@ def predictions(model, device, loader):
 
 
 # 设置训练参数
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 in_channels = 1300  # 输入特征的维度
 hidden_channels = 1024  # 隐层特征的维度
 num_classes = 1  # 分类类别的数量
@@ -164,6 +165,8 @@ for m in model.modules():
 # 定义损失函数和优化器
 initial_lr = 0.000002 # 学习率
 epochs = 10  # 训练轮数
+eval_every = 1  # 每隔几轮评估一次测试/验证集 (最后一轮总会评估)
+eval_interval = None  # 或者: 距上次评估超过这么多秒时评估
 criterion = nn.MSELoss(reduction='sum')
 optimizer = optim.Adam(model.parameters(), lr=initial_lr)
 
@@ -171,6 +174,7 @@ optimizer = optim.Adam(model.parameters(), lr=initial_lr)
 best_loss = float('inf')  # 初始最佳损失设为无穷大
 
 print('Training start...............')
+evaluate_now = EvalSchedule(eval_every, eval_interval, last_epoch=epochs)
 model.train()
 for epoch in range(1, epochs + 1):
     if epoch < 10:
@@ -178,15 +182,21 @@ for epoch in range(1, epochs + 1):
         for param_group in optimizer.param_groups:
             param_group['lr'] = lr
     optimizer = optim.Adam(model.parameters(), lr=lr)
-    train(model, device, train_loader, optimizer, criterion)
-    train_accuracy = test(model, device, train_loader, criterion)
+    epoch_start = time.perf_counter()
+    train_metrics = train(model, device, train_loader, optimizer, criterion).result()
+    epoch_time = time.perf_counter() - epoch_start
+    if not evaluate_now(epoch):
+        print(f'Epoch: {epoch}, Train_Loss: {train_metrics["Loss"]:.8f}, Train_R2: {train_metrics["R2"]:.4f}, Time: {epoch_time:.1f}s, Steps/s: {len(train_loader) / epoch_time:.2f}')
+        continue
+    eval_start = time.perf_counter()
     test_accuracy = test(model, device, test_loader, criterion)
     val_accuracy = test(model, device, val_loader, criterion)
     val1_accuracy = test(model, device, val1_loader, criterion)
     if test_accuracy < best_loss:
         best_loss = test_accuracy
         torch.save(model.state_dict(), '/home/bli/homology/best_model.pt')
-    print(f'Epoch: {epoch}, Train_Loss: {train_accuracy:.8f}, Test_Loss: {test_accuracy:.8f}, ValLoss: {val_accuracy:.8f}, Val1Loss: {val1_accuracy:.8f}')
+    evaluate_now.mark()
+    print(f'Epoch: {epoch}, Train_Loss: {train_metrics["Loss"]:.8f}, Train_R2: {train_metrics["R2"]:.4f}, Test_Loss: {test_accuracy:.8f}, ValLoss: {val_accuracy:.8f}, Val1Loss: {val1_accuracy:.8f}, Time: {epoch_time:.1f}s, Steps/s: {len(train_loader) / epoch_time:.2f}, Eval: {time.perf_counter() - eval_start:.1f}s')
 
 # print('Seed = ' +  str(seed) + ' Training finished.')
 